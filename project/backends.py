@@ -0,0 +1,28 @@
+# Importations & Settings
+
+import importlib
+
+
+# %% Lazy chart backends
+
+class LazyModule:
+    """Stand-in for a module imported on first attribute access.
+
+    Chart libraries take longer to import than the rest of the app together, and each is only used by a few
+    sections: with `alt = LazyModule('altair')` at the top of the app, altair is imported by the first section that
+    draws an altair chart, not at startup.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.module = None
+
+    def __getattr__(self, attribute):
+        if self.module is None:
+            self.module = importlib.import_module(self.name)
+
+        return getattr(self.module, attribute)
+
+
+alt = LazyModule('altair')
+px = LazyModule('plotly.express')
@@ -0,0 +1,209 @@
+# Importations & Settings
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import chartcases
+import codes
+import cube
+import dimensions
+import sortedindex
+import spatial
+import tiles
+from pipeline import CleaningPipeline, tagFrame
+
+SIZES = {'1M': 1000000, '10M': 10000000, '50M': 50000000}
+DUPLICATES = 0.02  # Share of rows repeated, as in the real files
+
+
+# %% Synthetic DVF data
+
+def syntheticYear(rows, year, rng):
+    """Raw rows shaped like ingest.readColumns output: DVF columns and dtypes, strings shared from small pools."""
+    departments = np.array(codes.DEPARTMENTS, dtype=object)
+    dep = rng.integers(0, len(departments), rows)
+    dep[rng.random(rows) < 0.2] = codes.DEPARTMENTS.index('75')  # Paris and its suburbs weigh more
+    dep[rng.random(rows) < 0.1] = codes.DEPARTMENTS.index('78')
+
+    communes = np.array(['Commune %d' % i for i in range(5000)] + ['Versailles', 'Paris 8e Arrondissement'],
+                        dtype=object)
+    prefixes = np.array([int(code) * 1000 if code.isdigit() and len(code) == 2 else
+                         (20000 if code in ('2A', '2B') else int(code) * 100) for code in codes.DEPARTMENTS])
+
+    latitude = np.where(rng.random(rows) < 0.4, rng.normal(48.86, 0.15, rows), rng.uniform(42.5, 51, rows))
+    longitude = np.where(np.abs(latitude - 48.86) < 0.5, rng.normal(2.35, 0.2, rows), rng.uniform(-4.5, 8, rows))
+    located = rng.random(rows) > 0.02
+
+    df = pd.DataFrame({
+        'id_mutation': ('%d-' % year) + pd.Series(np.arange(rows) // 2).astype(str).to_numpy(object),  # Two lots a sale
+        'numero_disposition': np.ones(rows),
+        'date_mutation': pd.to_datetime('%d-01-01' % year) + pd.to_timedelta(rng.integers(0, 365, rows), unit='D'),
+        'nature_mutation': np.array(['Vente', "Vente en l'état futur d'achèvement", 'Echange', 'Adjudication'],
+                                    dtype=object)[rng.choice(4, rows, p=[0.9, 0.05, 0.03, 0.02])],
+        'valeur_fonciere': np.round(rng.lognormal(12, 1, rows)),
+        'code_postal': np.where(rng.random(rows) < 0.01, np.nan, prefixes[dep] + rng.integers(0, 21, rows) * 10),
+        'nom_commune': communes[rng.integers(0, len(communes), rows)],
+        'code_departement': departments[dep],
+        'nombre_lots': rng.integers(0, 3, rows).astype('float64'),
+        'type_local': np.array(['Maison', 'Appartement', 'Dépendance', 'Local industriel. commercial ou assimilé',
+                                None], dtype=object)[rng.integers(0, 5, rows)],
+        'surface_reelle_bati': np.where(rng.random(rows) < 0.2, np.nan, rng.integers(9, 250, rows)),
+        'nombre_pieces_principales': rng.integers(0, 8, rows).astype('float64'),
+        'surface_terrain': np.where(rng.random(rows) < 0.6, np.nan, rng.integers(50, 2000, rows)),
+        'longitude': np.where(located, longitude, np.nan),
+        'latitude': np.where(located, latitude, np.nan)})
+
+    return pd.concat([df, df.iloc[:int(rows * DUPLICATES)]], ignore_index=True)
+
+
+def syntheticFrames(rows, years=(2019, 2020), seed=0):
+    """{year: raw frame}, rows split evenly across years."""
+    rng = np.random.default_rng(seed)
+
+    return {str(year): syntheticYear(rows // len(years), year, rng) for year in years}
+
+
+# %% Measurements
+
+def measure(function, *args, memory=False):
+    """Result, wall time and, with memory=True, peak memory allocated during the call (tracemalloc)."""
+    if memory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    result = function(*args)
+    seconds = time.perf_counter() - start
+
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+
+    return result, {'seconds': round(seconds, 4), 'peak_mb': None if peak is None else round(peak, 1)}
+
+
+def runCases(frames, dpt, memory):
+    import st_valeurs_foncieres as app  # Chart helpers, called without their Streamlit cache
+
+    results = []
+
+    def record(name, function, *args):
+        result, stats = measure(function, *args, memory=memory)
+        results.append(dict(name=name, **stats))
+        print('%-28s %9.3f s %10s MB' % (name, stats['seconds'], stats['peak_mb']), flush=True)
+
+        return result
+
+    # Cleaning steps, in order, on one pipeline
+    pipeline = CleaningPipeline(frames, dpt)
+    for step in CleaningPipeline.STEPS:
+        record(step, getattr(pipeline, step))
+    df = pipeline.df
+    tagFrame(df, 'bench')
+
+    # Precomputed structures
+    cubes = record('buildCube', cube.buildCube, df, dpt)
+    df_tiles = record('buildTiles', tiles.buildTiles, df)
+    index = record('SpatialIndex', spatial.SpatialIndex, df)
+    record('SortedIndex', sortedindex.SortedIndex, df, 'valeur_fonciere')
+
+    # Chart helpers
+    for name, args in chartcases.chartCases(df, cubes, df_tiles, index).items():
+        function = getattr(app, name)
+        record(name, getattr(function, '__wrapped__', function), *args)
+
+    return results
+
+
+def importTime(module='st_valeurs_foncieres'):
+    """Seconds to import the app in a fresh interpreter, as paid by every restart of a worker."""
+    code = 'import time; start = time.perf_counter(); import %s; print(time.perf_counter() - start)' % module
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+
+    return float(output.split()[-1])
+
+
+def runBenchmark(rows, memory=True, seed=0):
+    """Time every case, then run them again under tracemalloc for their peak memory: it slows Python-heavy code
+    down by an order of magnitude, so the timings come from the first run only."""
+    dpt = pd.read_csv(dimensions.DEPARTMENTS_CSV, sep=',')
+    frames = syntheticFrames(rows, seed=seed)
+
+    results = runCases(frames, dpt, memory=False)
+    if memory:
+        peaks = {result['name']: result['peak_mb'] for result in runCases(frames, dpt, memory=True)}
+        for result in results:
+            result['peak_mb'] = peaks[result['name']]
+
+    seconds = importTime()
+    results.append({'name': 'import app', 'seconds': round(seconds, 4), 'peak_mb': None})
+    print('%-28s %9.3f s' % ('import app', seconds), flush=True)
+
+    return {'rows': rows,
+            'seed': seed,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10, 1),
+            'results': results}
+
+
+# %% Comparison
+
+def compare(old, new, threshold=1.2):
+    """Print the time ratio of each benchmark between two runs, return the number slower than threshold."""
+    before = {result['name']: result for result in old['results']}
+    regressions = 0
+
+    for result in new['results']:
+        if result['name'] not in before:
+            continue
+
+        ratio = result['seconds'] / max(before[result['name']]['seconds'], 1e-6)
+        slower = ratio > threshold and result['seconds'] > 0.01  # Ignore the noise of tiny timings
+        regressions += slower
+        print('%-28s %9.3f s -> %9.3f s  x%.2f%s' % (result['name'], before[result['name']]['seconds'],
+                                                     result['seconds'], ratio, '  SLOWER' if slower else ''))
+
+    return regressions
+
+
+def parseSize(size):
+    return SIZES[size] if size in SIZES else int(size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time the cleaning steps and chart helpers on synthetic DVF data.')
+    parser.add_argument('sizes', nargs='*', default=['1M'], help='Rows: 1M, 10M, 50M or a number')
+    parser.add_argument('--output', default='bench-%s.json', help='%%s is replaced by the size')
+    parser.add_argument('--compare', help='Earlier JSON output to compare the run with (first size only)')
+    parser.add_argument('--threshold', type=float, default=1.2)
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help='Skip the tracemalloc run')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    regressions = 0
+    for size in args.sizes:
+        print('# %s rows' % size)
+        report = runBenchmark(parseSize(size), args.memory, args.seed)
+
+        with open(args.output.replace('%s', size), 'w') as file:
+            json.dump(report, file, indent=2)
+
+        if args.compare and size == args.sizes[0]:
+            with open(args.compare) as file:
+                regressions += compare(json.load(file), report, args.threshold)
+
+    raise SystemExit(1 if regressions else 0)
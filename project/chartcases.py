@@ -0,0 +1,37 @@
+# Importations & Settings
+
+import os
+
+import geometry
+
+
+# %% Chart helper cases
+
+def chartCases(df, cubes, df_tiles, index, directory='.'):
+    """Arguments of each chart-data helper of the app, {name: args}, on a cleaned frame and the artifacts built on it.
+
+    The map per commune is left out when its geojson was not downloaded.
+    """
+    year = int(df['date_mutation'].dt.year.iloc[0])
+
+    cases = {'dfMaisonMap': (df_tiles, 'France', 10, 500000),
+             'dfMaisonMapRows': (df, 'Paris and its inner suburbs'),
+             'dfComparableSales': (index, 'Versailles, Château', 'Appartement', 60, 20),
+             'dfMaisonBar': (cubes['department'], year),
+             'dfMaisonBarRows': ({year: df},),
+             'dfArrondParis': (cubes['paris'], year),
+             'dfArrondParisStats': (df, True),
+             'dfArrondParisRows': ({year: df},),
+             'dfAppartVersailles': (cubes['versailles'], 'month'),
+             'dfAppartVersaillesStats': (df, 'month', True),
+             'dfAppartVersaillesRows': (df,),
+             'dfSalesType': (cubes['department'], 'month'),
+             'dfSalesRegion': (cubes['department'], 'month'),
+             'dfMostApartments': (cubes['department'],),
+             'dfSurfaceDep': (cubes['department'],),
+             'dfValueCommune': (cubes['commune'], '78')}
+
+    if not os.path.exists(os.path.join(directory, geometry.COMMUNES_GEOJSON)):
+        del cases['dfValueCommune']
+
+    return cases
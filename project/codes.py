@@ -0,0 +1,45 @@
+# Importations & Settings
+
+import numpy as np
+import pandas as pd
+
+
+# %% Reference codes
+
+# Metropolitan departments (20 is split into Corse-du-Sud 2A and Haute-Corse 2B) and overseas departments
+DEPARTMENTS = sorted(['%02d' % i for i in range(1, 96) if i != 20] + ['2A', '2B'] +
+                     [str(i) for i in range(971, 977)])
+
+
+# %% Normalization Functions
+# Both functions only format the distinct values of a column (a few thousand at most) and build the result from
+# integer codes, instead of calling Python once per row.
+
+def formatDepartment(value):
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        value = '%d' % value
+
+    return str(value).strip().upper().zfill(2)
+
+
+def normalizeDepartmentCode(series):
+    """Return department codes as a categorical over DEPARTMENTS ('01', '2A', '971'...), unknown codes are null."""
+    codes, uniques = pd.factorize(series)  # -1 for missing values
+
+    positions = pd.Index(DEPARTMENTS).get_indexer([formatDepartment(value) for value in uniques])
+    positions = np.append(positions, -1)  # codes == -1 picks the trailing -1
+
+    return pd.Series(pd.Categorical.from_codes(positions[codes], categories=DEPARTMENTS),
+                     index=series.index, name=series.name)
+
+
+def normalizePostalCode(series):
+    """Return 5-digit postal codes as a categorical, null where the code is missing or not a number."""
+    numbers = pd.to_numeric(series, errors='coerce')
+    numbers = numbers.where((numbers > 0) & (numbers < 100000))
+
+    codes, uniques = pd.factorize(numbers, sort=True)
+    categories = ['%05d' % value for value in uniques]
+
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories),
+                     index=series.index, name=series.name)
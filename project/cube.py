@@ -0,0 +1,199 @@
+# Importations & Settings
+
+import os
+
+import numpy as np
+import pandas as pd
+
+import dimensions
+import ingest
+import periods
+import sqlengine
+from pipeline import cleanPath
+
+
+# %% Cube definition
+
+# Every chart filters and groups on a subset of these. nom_departement and nom_region depend on code_departement and
+# year and quarter on month, so they do not add cells to the cube. Weeks split some months in two.
+DIMENSIONS = ['year', 'quarter', 'month', 'week', 'code_departement', 'nom_departement', 'nom_region', 'nom_commune',
+              'code_postal', 'type_local']
+FORMAT = 3  # Bumped when the dimensions, measures or roll-ups change
+
+# Communes and postal codes make the full cube almost as long as the rows, so it is stored as one roll-up per chart
+# grain instead: {name: (dimensions, rows kept)}
+ROLLUPS = {'department': (['year', 'quarter', 'month', 'week', 'code_departement', 'nom_departement', 'nom_region',
+                           'type_local'], {}),
+           'paris': (['year', 'code_departement', 'code_postal'], {'code_departement': ['75']}),
+           'versailles': (['year', 'quarter', 'month', 'week', 'nom_commune', 'type_local'],
+                          {'nom_commune': ['Versailles']}),
+           'commune': (['year', 'code_departement', 'nom_commune'], {})}  # Only for the map per commune
+
+MEASURES = {'value': 'valeur_fonciere',
+            'surface': 'surface_reelle_bati',
+            'value_m2': None}  # valeur_fonciere / surface_reelle_bati, only where the surface is positive
+
+
+def measureColumns(measure):
+    return [measure + suffix for suffix in ('_n', '_sum', '_sumsq', '_min', '_max')]
+
+
+# The same dimensions and measures as SQL expressions over the cleaned rows
+SQL_DIMENSIONS = {'year': 'CAST(year(date_mutation) AS SMALLINT)'}  # Other dimensions are columns of the rows
+SQL_MEASURES = {'value': 'CAST(valeur_fonciere AS DOUBLE)',
+                'surface': 'CAST(surface_reelle_bati AS DOUBLE)',
+                'value_m2': 'CASE WHEN surface_reelle_bati > 0 '
+                            'THEN CAST(valeur_fonciere AS DOUBLE) / CAST(surface_reelle_bati AS DOUBLE) END'}
+
+
+# %% Build
+
+def buildCube(df, dpt, rollups=ROLLUPS):
+    """Aggregate the cleaned rows into each roll-up: {name: one row per combination of its dimensions}.
+
+    Each measure stores count of non-null values, sum, sum of squares, min and max, so means, variances and extrema
+    of any coarser roll-up can be derived from the cube alone. `count` is the number of rows, null values included.
+    """
+    regions = df['nom_region'] if 'nom_region' in df.columns else \
+        dimensions.dimensionTable(dpt).lookup(df['code_departement'], 'nom_region')
+    keys = df[periods.PERIODS] if set(periods.PERIODS) <= set(df.columns) else periods.periodKeys(df['date_mutation'])
+
+    rows = pd.DataFrame({'year': df['date_mutation'].dt.year.astype('Int16'),
+                         'quarter': keys['quarter'],
+                         'month': keys['month'],
+                         'week': keys['week'],
+                         'code_departement': df['code_departement'],
+                         'nom_departement': df['nom_departement'],
+                         'nom_region': regions,
+                         'nom_commune': df['nom_commune'],
+                         'code_postal': df['code_postal'],
+                         'type_local': df['type_local']})
+
+    value = df['valeur_fonciere'].astype('float64')  # Stored as float32, summed in float64
+    surface = df['surface_reelle_bati'].astype('float64')
+    values = {'value': value,
+              'surface': surface,
+              'value_m2': (value / surface).where(surface > 0)}
+
+    aggregations = {'count': ('year', 'size')}
+    for measure, series in values.items():
+        rows[measure] = series
+        rows[measure + '_sq'] = series ** 2
+        aggregations.update({measure + '_n': (measure, 'count'),
+                             measure + '_sum': (measure, 'sum'),
+                             measure + '_sumsq': (measure + '_sq', 'sum'),
+                             measure + '_min': (measure, 'min'),
+                             measure + '_max': (measure, 'max')})
+
+    cubes = {}
+    for name, (by, kept) in rollups.items():
+        selected = rows
+        for dimension, values in kept.items():
+            selected = selected[selected[dimension].isin(values).to_numpy()]
+
+        cubes[name] = selected.groupby(by, dropna=False, observed=True, sort=False).agg(**aggregations).reset_index()
+
+    return cubes
+
+
+def cubePath(version, name, directory='.'):
+    return os.path.join(directory, ingest.CACHE_DIR, 'cube-%s-%s-v%d.parquet' % (version, name, FORMAT))
+
+
+def loadCube(rows, dpt, version, directory='.'):
+    """Roll-ups the app queries: those of storeCube, or SQL stand-ins when the duckdb engine is on.
+
+    With the duckdb engine on and the cleaned rows saved, nothing is loaded: each roll-up is an empty frame pointing
+    at the rows' parquet file, which query() aggregates in SQL.
+    """
+    if sqlengine.enabled(cleanPath(version, directory)):
+        return {name: sqlCube(cleanPath(version, directory), kept) for name, (_, kept) in ROLLUPS.items()}
+
+    return storeCube(rows, dpt, version, directory)
+
+
+def storeCube(rows, dpt, version, directory='.'):
+    """Read the roll-ups of a dataset version from disk, building and persisting them on first use.
+
+    rows() returns the cleaned frame: it is only called when the roll-ups have to be built.
+    """
+    paths = {name: cubePath(version, name, directory) for name in ROLLUPS}
+
+    if ingest.HAS_PARQUET and all(os.path.exists(path) for path in paths.values()):
+        return {name: pd.read_parquet(path) for name, path in paths.items()}
+
+    cubes = buildCube(rows(), dpt)
+
+    if ingest.HAS_PARQUET:
+        for name, path in paths.items():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            cubes[name].to_parquet(path + '.tmp', index=False)
+            os.replace(path + '.tmp', path)
+
+    return cubes
+
+
+def sqlCube(path, kept):
+    cube = pd.DataFrame()
+    cube.attrs.update({'rows': path, 'kept': kept})  # Rows' parquet file, rows of the roll-up
+
+    return cube
+
+
+# %% Queries
+
+def query(cube, by, **filters):
+    """Roll the cube up to the `by` dimensions, keeping cells matching `filters` (a value or a list of values).
+
+    A roll-up returned by loadCube with the duckdb engine on is aggregated in SQL from the cleaned rows instead, with
+    the same values up to rounding: sums are added in another order. Keys come as plain values, sorted.
+    """
+    filters = {dimension: list(value) if isinstance(value, (list, tuple, set)) else [value]
+               for dimension, value in filters.items()}
+
+    if 'rows' in cube.attrs:
+        return querySql(cube, by, filters)
+
+    aggregations = {'count': 'sum'}
+    for measure in MEASURES:
+        n, total, sumsq, low, high = measureColumns(measure)
+        aggregations.update({n: 'sum', total: 'sum', sumsq: 'sum', low: 'min', high: 'max'})
+
+    mask = np.ones(len(cube), dtype=bool)
+    for dimension, values in filters.items():
+        mask &= cube[dimension].isin(values).to_numpy()
+
+    return cube[mask].groupby(by, observed=True).agg(aggregations)
+
+
+def querySql(cube, by, filters):
+    def expression(dimension):
+        return SQL_DIMENSIONS.get(dimension, sqlengine.quote(dimension))
+
+    keys = [by] if isinstance(by, str) else list(by)
+    kept = list(cube.attrs['kept'].items()) + list(filters.items())
+
+    measures = {'count': 'COUNT(*)'}
+    for measure, value in SQL_MEASURES.items():
+        n, total, sumsq, low, high = measureColumns(measure)
+        measures.update({n: 'COUNT(%s)' % value,
+                         total: 'COALESCE(FSUM(%s), 0)' % value,  # Compensated sums, 0 for no value as in pandas
+                         sumsq: 'COALESCE(FSUM(%s * %s), 0)' % (value, value),
+                         low: 'MIN(%s)' % value,
+                         high: 'MAX(%s)' % value})
+
+    agg = sqlengine.rollup(cube.attrs['rows'], {key: expression(key) for key in keys},
+                           [(expression(dimension), values) for dimension, values in kept], measures)
+
+    return agg.set_index(by)
+
+
+def mean(agg, measure):
+    return agg[measure + '_sum'] / agg[measure + '_n'].where(agg[measure + '_n'] > 0)
+
+
+def std(agg, measure):
+    n = agg[measure + '_n'].where(agg[measure + '_n'] > 1)
+    variance = (agg[measure + '_sumsq'] - agg[measure + '_sum'] ** 2 / n) / (n - 1)
+
+    return np.sqrt(variance.clip(lower=0))
@@ -0,0 +1,78 @@
+# Importations & Settings
+
+import os
+
+import numpy as np
+import pandas as pd
+
+# The columns the app has always deduplicated on. id_mutation stays out: two identical dispositions of different
+# mutations are still duplicates. nom_departement is derived from code_departement, it cannot tell two rows apart.
+KEY = ['numero_disposition', 'date_mutation', 'nature_mutation', 'valeur_fonciere', 'code_postal', 'nom_commune',
+       'code_departement', 'nombre_lots', 'type_local', 'surface_reelle_bati', 'nombre_pieces_principales',
+       'surface_terrain', 'longitude', 'latitude']
+FORMAT = 1  # Bumped when KEY or the hashing change: runs of another format are ignored
+RUN_SUFFIX = '-k%d.npy' % FORMAT
+
+
+# %% Fingerprints
+
+def fingerprints(df, key=KEY):
+    """64-bit hash of each row over the key columns. It only depends on the values, not on dtypes or categories."""
+    return pd.util.hash_pandas_object(df[key], index=False).to_numpy()
+
+
+def firstOccurrences(fps):
+    return ~pd.Series(fps).duplicated().to_numpy()
+
+
+# %% Persisted index
+
+class DedupIndex:
+    """Fingerprints already ingested, as sorted runs saved in a directory: one .npy file per chunk of a source.
+
+    A run is saved next to the rows of its chunk, so the index on disk covers exactly the rows written. Runs are
+    memory-mapped and searched one by one: adding a chunk costs the size of the chunk, not the size of the index.
+    """
+
+    def __init__(self, directory=None, sources=None):
+        self.directory = directory
+        self.runs = []
+
+        if directory and os.path.isdir(directory):
+            for name in sorted(os.listdir(directory)):
+                if name.endswith(RUN_SUFFIX) and (sources is None or runSource(name) in sources):
+                    self.runs.append(np.load(os.path.join(directory, name), mmap_mode='r'))
+
+    def __len__(self):
+        return sum(len(run) for run in self.runs)
+
+    def contains(self, fps):
+        found = np.zeros(len(fps), dtype=bool)
+
+        for run in self.runs:
+            positions = np.searchsorted(run, fps)
+            inside = positions < len(run)
+            found[inside] |= run[positions[inside]] == fps[inside]
+
+        return found
+
+    def unseen(self, fps):
+        """Mask of the rows to keep: first occurrence in the batch and not ingested before."""
+        return firstOccurrences(fps) & ~self.contains(fps)
+
+    def add(self, fps, source=None, number=0):
+        """Add a run of fingerprints, saved as chunk `number` of `source` when given."""
+        run = np.unique(fps)
+        self.runs.append(run)
+
+        if source is not None:
+            path = os.path.join(self.directory, '%s-%05d%s' % (source, number, RUN_SUFFIX))
+            os.makedirs(self.directory, exist_ok=True)
+
+            with open(path + '.tmp', 'wb') as file:
+                np.save(file, run)
+            os.replace(path + '.tmp', path)
+
+
+def runSource(name):
+    return name.rsplit('-', 2)[0]  # <source>-<chunk>-k<FORMAT>.npy
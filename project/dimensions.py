@@ -0,0 +1,62 @@
+# Importations & Settings
+
+import numpy as np
+import pandas as pd
+
+import codes
+
+DEPARTMENTS_CSV = 'departements-france.csv'  # code_departement, nom_departement, code_region, nom_region
+# Source : https://www.data.gouv.fr/fr/datasets/departements-de-france/
+
+ATTRIBUTES = ['nom_departement', 'code_region', 'nom_region']
+
+
+# %% Lookup tables
+
+class DimensionTable:
+    """Department attributes as integer-coded arrays, one position per department code.
+
+    A join of a categorical code_departement column is then a lookup per category followed by a take on the row
+    codes: the work per row is one integer gather, whatever the number of rows.
+    """
+
+    def __init__(self, dpt):
+        departments = dpt.astype({'code_departement': str}).drop_duplicates('code_departement')
+
+        self.codes = pd.Index([codes.formatDepartment(code) for code in departments['code_departement']])
+        self.attributes = {}
+
+        for attribute in ATTRIBUTES:
+            values = departments[attribute].astype(str)
+            categories = pd.Index(sorted(values.unique()))
+            self.attributes[attribute] = (categories, categories.get_indexer(values).astype('int32'))
+
+    def positions(self, code_departement):
+        """Position in the table of each row's department, -1 when unknown."""
+        series = code_departement if isinstance(code_departement.dtype, pd.CategoricalDtype) else \
+            code_departement.astype('category')
+
+        per_category = np.append(self.codes.get_indexer(series.cat.categories.astype(str)), -1).astype('int32')
+
+        return per_category[series.cat.codes.to_numpy()]  # Code -1 (null) takes the appended -1
+
+    def lookup(self, code_departement, attribute):
+        """Categorical column of an attribute, aligned on a code_departement column."""
+        categories, values = self.attributes[attribute]
+        row_codes = np.append(values, -1)[self.positions(code_departement)]  # Position -1 picks the trailing -1
+
+        return pd.Series(pd.Categorical.from_codes(row_codes, categories=categories),
+                         index=code_departement.index, name=attribute)
+
+
+TABLES = {}
+
+
+def dimensionTable(dpt):
+    """DimensionTable of a departments frame, built once per content of the frame."""
+    key = int(pd.util.hash_pandas_object(dpt).sum())
+
+    if key not in TABLES:
+        TABLES[key] = DimensionTable(dpt)
+
+    return TABLES[key]
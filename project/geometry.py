@@ -0,0 +1,198 @@
+# Importations & Settings
+
+import json
+import os
+import re
+import unicodedata
+
+import numpy as np
+
+import ingest
+
+DEPARTMENTS_GEOJSON = 'departements-version-simplifiee.geojson'
+# Source : https://github.com/gregoiredavid/france-geojson/blob/master/departements-version-simplifiee.geojson
+COMMUNES_GEOJSON = 'communes-avec-outre-mer.geojson'  # About 35,000 communes, overseas departments included
+# Source : https://github.com/gregoiredavid/france-geojson/blob/master/communes-avec-outre-mer.geojson
+
+# Douglas-Peucker tolerance of each variant, in degrees. 0.02° (about 2 km) is under a pixel on a map of France
+LEVELS = {'detailed': 0, 'medium': 0.005, 'coarse': 0.02}
+PRECISION = 1e-5  # Coordinates are stored as int32 multiples of this, about 1 m
+FORMAT = 3  # Bumped when the arrays of the .npz files change
+
+
+# %% Simplification
+
+def simplifyRing(points, tolerance):
+    """Douglas-Peucker on a closed ring. A ring simplified below 4 points is no longer a polygon, it is kept whole."""
+    if tolerance <= 0 or len(points) <= 4:
+        return points
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, len(points) // 2, len(points) - 1]] = True
+    stack = [(0, len(points) // 2), (len(points) // 2, len(points) - 1)]
+
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        segment = points[end] - points[start]
+        offsets = points[start + 1:end] - points[start]
+        length = np.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            keep[start + 1 + farthest] = True
+            stack += [(start, start + 1 + farthest), (start + 1 + farthest, end)]
+
+    return points[keep] if keep.sum() >= 4 else points
+
+
+def polygons(geometry):
+    return [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+
+
+# %% Codes & names
+
+def departmentOf(code):
+    """Department of an INSEE commune code: 3 characters overseas (97x), 2 otherwise (2A / 2B included)."""
+    return code[:3] if code.startswith('97') else code[:2]
+
+
+def nameKey(name):
+    """Case and accent insensitive commune name. Paris, Lyon and Marseille arrondissements map to their city."""
+    name = unicodedata.normalize('NFKD', str(name)).encode('ascii', 'ignore').decode().casefold()
+    name = re.sub(r'\s+\d+(er|e|eme)?(\s+arrondissement)?$', '', name.strip())
+
+    return re.sub(r'[^a-z0-9]+', ' ', name).strip()
+
+
+# %% Compact binary variants
+
+def encode(features, tolerance):
+    """Flatten the rings of the features into int32 coordinates with offset arrays (npz arrays)."""
+    coordinates, rings, parts, shapes, bounds = [], [0], [0], [0], []
+
+    for feature in features:
+        points = np.concatenate([np.asarray(ring, dtype='float64') for polygon in polygons(feature['geometry'])
+                                 for ring in polygon])
+        bounds.append(np.concatenate([points.min(axis=0), points.max(axis=0)]))
+
+        for polygon in polygons(feature['geometry']):
+            for ring in polygon:
+                points = simplifyRing(np.asarray(ring, dtype='float64'), tolerance)
+                coordinates.append(np.round(points / PRECISION).astype('int32'))
+                rings.append(rings[-1] + len(points))
+            parts.append(parts[-1] + len(polygon))
+        shapes.append(len(parts) - 1)
+
+    return {'coordinates': np.concatenate(coordinates),
+            'rings': np.asarray(rings, dtype='int64'),  # Point offset of each ring
+            'parts': np.asarray(parts, dtype='int64'),  # Ring offset of each polygon
+            'shapes': np.asarray(shapes, dtype='int64'),  # Polygon offset of each feature
+            'bounds': np.asarray(bounds, dtype='float32'),  # West, south, east, north of each feature
+            'codes': np.asarray([feature['properties']['code'] for feature in features]),
+            'names': np.asarray([feature['properties']['nom'] for feature in features])}
+
+
+def decode(arrays, number):
+    """GeoJSON Feature number of a variant. Feature ids are the names, as in the charts."""
+    rings, parts, shapes = arrays['rings'], arrays['parts'], arrays['shapes']
+
+    def ring(index):
+        return np.round(arrays['coordinates'][rings[index]:rings[index + 1]] * PRECISION, 5).tolist()
+
+    shape = [[ring(index) for index in range(parts[part], parts[part + 1])]
+             for part in range(shapes[number], shapes[number + 1])]
+    geometry = {'type': 'Polygon', 'coordinates': shape[0]} if len(shape) == 1 else \
+        {'type': 'MultiPolygon', 'coordinates': shape}
+    code, name = str(arrays['codes'][number]), str(arrays['names'][number])
+
+    return {'type': 'Feature', 'id': name, 'properties': {'code': code, 'nom': name}, 'geometry': geometry}
+
+
+# %% Asset store
+
+def variantPath(url, level, directory='.'):
+    return os.path.join(directory, ingest.CACHE_DIR, 'geometry-%s-%s-%s-v%d.npz' % (
+        ingest.fileStem(url), ingest.sourceKey(url)[:12], level, FORMAT))
+
+
+class GeometryStore:
+    """Simplified variants of a GeoJSON file, built once per version of the file and saved as .npz.
+
+    Features are decoded on first use only and kept: a subset (a department, a bounding box) only decodes its own
+    features, and callers get the same dicts back every time, there is no file to re-read on a rerun.
+    """
+
+    def __init__(self, url=DEPARTMENTS_GEOJSON, directory='.'):
+        self.url = url
+        self.directory = directory
+        self.levels = {}
+        self.features = {}
+
+    def arrays(self, level):
+        if level in self.levels:
+            return self.levels[level]
+
+        path = variantPath(self.url, level, self.directory)
+
+        if os.path.exists(path):
+            with np.load(path) as arrays:
+                self.levels[level] = dict(arrays)
+                return self.levels[level]
+
+        with open(self.url, 'r') as file:
+            features = json.load(file)['features']
+        arrays = encode(features, LEVELS[level])
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as file:
+            np.savez_compressed(file, **arrays)
+        os.replace(path + '.tmp', path)
+
+        self.levels[level] = arrays
+        return arrays
+
+    def feature(self, number, level='medium'):
+        if (level, number) not in self.features:
+            self.features[level, number] = decode(self.arrays(level), number)
+
+        return self.features[level, number]
+
+    def select(self, numbers, level='medium'):
+        return {'type': 'FeatureCollection', 'features': [self.feature(number, level) for number in numbers]}
+
+    def geojson(self, level='medium'):
+        return self.select(range(len(self.arrays(level)['codes'])), level)
+
+    def department(self, department, level='medium'):
+        """Features of the communes of a department (INSEE codes start with the department code)."""
+        codes = self.arrays(level)['codes']
+
+        return self.select([number for number, code in enumerate(codes.tolist())
+                            if departmentOf(code) == department], level)
+
+    def bbox(self, south, west, north, east, level='medium'):
+        """Features overlapping a viewport."""
+        bounds = self.arrays(level)['bounds']
+        overlap = (bounds[:, 0] <= east) & (bounds[:, 2] >= west) & (bounds[:, 1] <= north) & (bounds[:, 3] >= south)
+
+        return self.select(np.flatnonzero(overlap).tolist(), level)
+
+    def names(self, level='medium'):
+        """Code -> feature id."""
+        arrays = self.arrays(level)
+
+        return dict(zip(arrays['codes'].tolist(), arrays['names'].tolist()))
+
+    def codes(self, department, level='medium'):
+        """Name key -> code of the communes of a department, to join DVF commune names on the geometry."""
+        arrays = self.arrays(level)
+
+        return {nameKey(name): code for code, name in zip(arrays['codes'].tolist(), arrays['names'].tolist())
+                if departmentOf(code) == department}
@@ -0,0 +1,129 @@
+# Importations & Settings
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401  (parquet engine)
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+
+# %% Schema
+
+COLS = ['id_mutation', 'numero_disposition', 'date_mutation', 'nature_mutation', 'valeur_fonciere', 'code_postal',
+        'nom_commune', 'code_departement', 'nombre_lots', 'type_local', 'surface_reelle_bati',
+        'nombre_pieces_principales', 'surface_terrain', 'longitude', 'latitude']
+
+DTYPES = {'id_mutation': 'object',
+          'numero_disposition': 'float64',
+          'nature_mutation': 'object',
+          'valeur_fonciere': 'float64',
+          'code_postal': 'float64',
+          'nom_commune': 'object',
+          'code_departement': 'object',  # '2A', '2B', '971'... must stay strings
+          'nombre_lots': 'float64',
+          'type_local': 'object',
+          'surface_reelle_bati': 'float64',
+          'nombre_pieces_principales': 'float64',
+          'surface_terrain': 'float64',
+          'longitude': 'float64',
+          'latitude': 'float64'}
+
+CACHE_DIR = '.dvf_cache'
+FORMAT = 2  # Bumped when COLS or DTYPES change, so that parquet copies are rebuilt
+
+
+# %% Source fingerprint
+
+def fileHash(path, chunk_size=1 << 20):
+    sha = hashlib.sha1()
+
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+
+def cacheDir(url):
+    path = os.path.join(os.path.dirname(url) or '.', CACHE_DIR)
+    os.makedirs(path, exist_ok=True)
+
+    return path
+
+
+def manifestPath(url):
+    return os.path.join(cacheDir(url), os.path.basename(url) + '.json')
+
+
+def readManifest(url):
+    try:
+        with open(manifestPath(url), 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def writeManifest(url, manifest):
+    with open(manifestPath(url), 'w') as file:
+        json.dump(manifest, file, indent=2)
+
+
+def sourceKey(url):
+    """Return the sha1 of the source file, only re-hashing it when its size or mtime changed."""
+    stat = os.stat(url)
+    manifest = readManifest(url)
+
+    if manifest.get('size') == stat.st_size and manifest.get('mtime') == stat.st_mtime_ns:
+        return manifest['sha1']
+
+    sha1 = fileHash(url)
+    manifest.update({'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha1': sha1})
+    writeManifest(url, manifest)
+
+    return sha1
+
+
+# %% Conversion
+
+def parseCsv(url, columns=COLS):
+    return pd.read_csv(url, sep=',', usecols=columns,
+                       dtype={col: DTYPES[col] for col in columns if col in DTYPES},
+                       parse_dates=['date_mutation'] if 'date_mutation' in columns else False)
+
+
+def fileStem(url):
+    return os.path.splitext(os.path.basename(url))[0]
+
+
+def parquetPath(url):
+    return os.path.join(cacheDir(url), '%s-%s-v%d.parquet' % (fileStem(url), sourceKey(url)[:16], FORMAT))
+
+
+def ingest(url):
+    """Convert a DVF csv to a typed, column-pruned parquet file once and return its path."""
+    path = parquetPath(url)
+
+    if not os.path.exists(path):
+        tmp = path + '.tmp'
+        parseCsv(url).to_parquet(tmp, index=False)
+        os.replace(tmp, path)  # never leave a half-written file under the final name
+
+        for name in os.listdir(cacheDir(url)):  # drop files built from older versions of the source
+            old = os.path.join(cacheDir(url), name)
+            if name.startswith(fileStem(url) + '-') and name.endswith('.parquet') and old != path:
+                os.remove(old)
+
+    return path
+
+
+def readColumns(url, columns=COLS):
+    if not HAS_PARQUET:  # no parquet engine: still avoid parsing unused columns
+        return parseCsv(url, columns)
+
+    return pd.read_parquet(ingest(url), columns=columns)
@@ -0,0 +1,103 @@
+# Importations & Settings
+
+import importlib.util
+import os
+
+import numpy as np
+import pandas as pd
+
+import codes
+import dedup
+import ingest
+import periods
+from backends import LazyModule
+from pipeline import CleaningPipeline, pipelineVersion, tagFrame
+
+HAS_POLARS = importlib.util.find_spec('polars') is not None
+pl = LazyModule('polars')  # Imported by the first query, not with the app
+
+# 'polars' cleans the years as one lazy query over their parquet copies when polars is installed, 'pandas' (the
+# default) runs CleaningPipeline
+ENGINE = os.environ.get('DVF_CLEANING', 'pandas')
+
+
+def enabled():
+    return ENGINE == 'polars' and HAS_POLARS and ingest.HAS_PARQUET
+
+
+# %% Lazy query
+
+def scanYear(path, position):
+    """chooseCol and modifyTypes of one year as a lazy frame: only the columns of ingest.COLS are read."""
+    postal = pl.col('code_postal').cast(pl.Float64, strict=False)
+    department = pl.col('code_departement').cast(pl.String).str.strip_chars().str.to_uppercase().str.zfill(2)
+
+    return (pl.scan_parquet(path)
+            .select(ingest.COLS)
+            .with_columns(pl.col('date_mutation').cast(pl.Datetime('ns')),
+                          pl.when((postal > 0) & (postal < 100000))
+                          .then(postal.cast(pl.Int64).cast(pl.String).str.zfill(5)).alias('code_postal'),
+                          pl.when(department.is_in(codes.DEPARTMENTS)).then(department).alias('code_departement'),
+                          pl.lit(position, pl.Int16).alias('year')))
+
+
+def cleanQuery(paths, across_years=False):
+    """The cleaning chain up to deleteDuplicates as one query plan, years kept in order and tagged by their position
+    in a `year` column."""
+    years = [scanYear(path, position) for position, path in enumerate(paths.values())]
+
+    if across_years:
+        return pl.concat(years).unique(subset=dedup.KEY, keep='first', maintain_order=True)
+
+    return pl.concat([frame.unique(subset=dedup.KEY, keep='first', maintain_order=True) for frame in years])
+
+
+# %% Cleaned pipeline
+
+def cleanYears(paths, dpt, versions, across_years=False):
+    """CleaningPipeline holding the same cleaned frame as CleaningPipeline(frames, dpt, across_years=...).run().
+
+    paths is {year: parquet copy of the year}, versions {year: version of the year}. The query runs on the streaming
+    engine, the small per-category steps (period keys, department attributes, compact types) in pandas afterwards.
+    """
+    df = cleanQuery(paths, across_years).collect(engine='streaming').to_pandas()
+    lengths = np.bincount(df.pop('year').to_numpy(), minlength=len(paths))
+
+    pipeline = CleaningPipeline({}, dpt)  # No raw frames: the steps already ran
+    pipeline.version = pipelineVersion(list(versions.values()), dpt, across_years)
+    pipeline.frames = dict.fromkeys(paths)
+    pipeline.setBounds(lengths.tolist())
+
+    # Period keys next to the date and categorical codes, in the column order of the pandas steps
+    keys = periods.periodKeys(df['date_mutation'])
+    df['code_postal'] = pd.Categorical(df['code_postal'], categories=sorted(df['code_postal'].dropna().unique()))
+    df['code_departement'] = pd.Categorical(df['code_departement'], categories=codes.DEPARTMENTS)
+    pipeline.df = pd.concat([df, keys], axis=1)
+
+    # Column views of the first rows of each year, indexed by their position in all the years as in CleaningPipeline
+    raw_lengths = [pl.scan_parquet(path).select(pl.len()).collect().item() for path in paths.values()]
+    starts = np.cumsum(raw_lengths) - raw_lengths
+
+    preview = CleaningPipeline({year: pl.read_parquet(path, columns=ingest.COLS, n_rows=5).to_pandas()
+                                for year, path in paths.items()}, dpt)
+    preview.chooseCol()
+    preview.df.index = np.concatenate([start + np.arange(stop - first)
+                                       for start, (first, stop) in zip(starts, preview.bounds.values())])
+
+    pipeline.views['chooseCol'] = {year: preview.year(year) for year in preview.bounds}
+    preview.modifyTypes()
+    preview.df['code_postal'] = preview.df['code_postal'].cat.set_categories(df['code_postal'].cat.categories)
+    pipeline.views['modifyTypes'] = {year: preview.year(year) for year in preview.bounds}
+
+    for step in ['addDepName', 'deleteDuplicates', 'compactTypes', 'concatenation']:
+        if step != 'deleteDuplicates':  # Done by the query
+            getattr(pipeline, step)()
+        tagFrame(pipeline.df, pipeline.version)
+        pipeline.views[step] = {year: pipeline.year(year).head() for year in pipeline.bounds}
+
+    # addDepName comes before deleteDuplicates in CleaningPipeline: its views are indexed by raw positions (the first
+    # rows of a year are the same unless one of them is a duplicate)
+    pipeline.views['addDepName'] = {year: view.set_axis(start + np.arange(len(view)))
+                                    for start, (year, view) in zip(starts, pipeline.views['addDepName'].items())}
+
+    return pipeline
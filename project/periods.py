@@ -0,0 +1,57 @@
+# Importations & Settings
+
+import numpy as np
+import pandas as pd
+
+
+# %% Period keys
+
+# Integer keys that sort in time order: YYYYWW (ISO week), YYYYMM and YYYYQ
+PERIODS = ['week', 'month', 'quarter']
+DTYPES = {'week': 'int32', 'month': 'int32', 'quarter': 'int16'}
+
+
+def periodKeys(dates):
+    """Week, month and quarter keys of a datetime Series, computed on the datetime64 integers (no string per row)."""
+    values = dates.to_numpy('datetime64[D]')
+    missing = np.isnat(values)
+    days = np.where(missing, np.datetime64('1970-01-01'), values)
+
+    months = days.astype('datetime64[M]').astype('int64')  # Months since 1970-01
+    year, month = months // 12 + 1970, months % 12 + 1
+
+    # The ISO week of a day is the week of its Thursday, 1970-01-01 was a Thursday
+    thursday = days - (days.astype('int64') + 3) % 7 + 3
+    week_year = thursday.astype('datetime64[Y]')
+    week = (thursday - week_year.astype('datetime64[D]')).astype('int64') // 7 + 1
+
+    keys = {'week': (week_year.astype('int64') + 1970) * 100 + week,
+            'month': year * 100 + month,
+            'quarter': year * 10 + (month - 1) // 3 + 1}
+
+    frame = pd.DataFrame({period: key.astype(DTYPES[period]) for period, key in keys.items()}, index=dates.index)
+
+    if missing.any():  # Nullable integers, only when there are missing dates
+        frame = frame.astype({period: dtype.capitalize() for period, dtype in DTYPES.items()})
+        frame.loc[missing] = pd.NA
+
+    return frame
+
+
+def addPeriods(df, column='date_mutation'):
+    """Add the period keys of a date column to df, in place."""
+    for period, keys in periodKeys(df[column]).items():
+        df[period] = keys
+
+    return df
+
+
+# %% Labels
+
+def periodLabel(key, period):
+    if period == 'week':
+        return '%d-W%02d' % (key // 100, key % 100)
+    if period == 'quarter':
+        return '%d-Q%d' % (key // 10, key % 10)
+
+    return '%d-%02d' % (key // 100, key % 100)
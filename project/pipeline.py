@@ -0,0 +1,260 @@
+# Importations & Settings
+
+import hashlib
+import os
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+import codes
+import dedup
+import dimensions
+import ingest
+import periods
+import runner
+import schema
+
+
+# %% Cache keys
+
+TAGGED = weakref.WeakValueDictionary()  # id -> frame, the frames tagged with their version
+
+
+def tagFrame(df, version):
+    """Make version the cache key of df (and only of df), return df."""
+    df.attrs['version'] = version
+    TAGGED[id(df)] = df
+
+    return df
+
+
+def frameKey(df):
+    """Cheap cache key of a frame: its version when it was tagged with tagFrame, a content hash otherwise.
+
+    pandas copies attrs to the frames derived from a frame (df[mask].attrs == df.attrs), so the version in attrs
+    does not tell a frame from its filtered copies: only the tagged object itself is keyed on it.
+    """
+    if TAGGED.get(id(df)) is df:
+        return df.attrs['version']
+
+    sha = hashlib.sha1(pd.util.hash_pandas_object(df).to_numpy().tobytes())  # Ordered, index included
+    sha.update(repr(df.dtypes).encode())  # Column names and types
+
+    return sha.hexdigest()[:16]
+
+
+def combineKeys(keys):
+    return hashlib.sha1(':'.join(keys).encode()).hexdigest()[:16]
+
+
+def pipelineVersion(keys, dpt, across_years=False):
+    """Version of the cleaned dataset, from the versions of the yearly frames: known before loading any of them."""
+    return combineKeys(list(keys) + [frameKey(dpt)] + ['across_years'] * across_years)
+
+
+FORMAT = 2  # Bumped when the cleaned columns or the saved state change
+
+
+def cleanPath(version, directory='.'):
+    return os.path.join(directory, ingest.CACHE_DIR, 'clean-%s-v%d.parquet' % (version, FORMAT))
+
+
+# %% Cleaning Pipeline
+
+PARALLEL_MIN_ROWS = 1000000  # Below this, starting worker processes costs more than it saves
+rows_lock = threading.Lock()
+
+
+def cleanPartition(frame, dpt):
+    """Run the cleaning steps on one partition of a year and return its rows, indexed by their position in the year."""
+    pipeline = CleaningPipeline({None: tagFrame(frame.reset_index(drop=True), 'partition')}, dpt)  # No key needed
+
+    for step in CleaningPipeline.STEPS:
+        getattr(pipeline, step)()
+
+    pipeline.df.index = frame.index[pipeline.kept]
+
+    return pipeline.df, pipeline.memory_before
+
+
+class CleaningPipeline:
+    """Cleans every year in one owned frame, step by step, without copying the whole dataset at each step.
+
+    The yearly frames given to the constructor are never mutated (they are shared cache outputs). The first step
+    selects the columns of each year into a single frame, every other step modifies that frame in place. Years stay
+    contiguous, so a yearly dataframe is a row slice of the owned frame.
+
+    Output frames are tagged with the dataset version (tagFrame), which the app uses as their cache key instead of
+    hashing their content.
+
+    With workers > 1 and enough rows, each year is split by department into partitions cleaned in worker processes,
+    then merged back in the original row order. Duplicated rows share their department, so deduplicating partitions
+    separately gives the same result.
+
+    Duplicates are found on 64-bit row fingerprints, within each year by default or across all years with
+    across_years=True.
+    """
+
+    STEPS = ['chooseCol', 'modifyTypes', 'addDepName', 'deleteDuplicates', 'compactTypes', 'concatenation']
+
+    def __init__(self, frames, dpt, workers=1, across_years=False):
+        self.frames = frames  # {year: raw dataframe}
+        self.dpt = dpt
+        self.workers = workers
+        self.across_years = across_years
+        self.version = pipelineVersion([frameKey(frame) for frame in frames.values()], dpt, across_years)
+        self.df = None
+        self.path = None  # Saved cleaned frame, read by rows()
+        self.bounds = {}
+        self.views = {}
+        self.kept = None
+        self.memory_before = None
+        self.memory = None
+
+    def run(self):
+        if self.workers > 1 and sum(len(frame) for frame in self.frames.values()) >= PARALLEL_MIN_ROWS:
+            return self.runParallel()
+
+        for step in self.STEPS:
+            getattr(self, step)()
+            tagFrame(self.df, self.version)
+            self.views[step] = {year: self.year(year).head() for year in self.bounds}
+
+        return self
+
+    def runParallel(self):
+        # The row-wise steps are replayed on the first rows of each year for the 'Show Dataframe' views
+        preview = CleaningPipeline({year: frame.head() for year, frame in self.frames.items()}, self.dpt)
+        for step in ['chooseCol', 'modifyTypes', 'addDepName']:
+            getattr(preview, step)()
+            self.views[step] = {year: preview.year(year) for year in preview.bounds}
+
+        per_year = max(1, self.workers // len(self.frames))
+        partitions = []
+        for year, frame in self.frames.items():
+            for positions in runner.hashPartitions(frame['code_departement'].to_numpy(), per_year):
+                partitions.append((year, frame.iloc[positions]))
+
+        cleaned = runner.mapPartitions(cleanPartition, [part for _, part in partitions], self.dpt,
+                                       workers=self.workers)
+
+        parts = schema.unionCategories([df for df, _ in cleaned])  # Otherwise concat turns categoricals to objects
+        years = [pd.concat([df for (part_year, _), df in zip(partitions, parts) if part_year == year]).sort_index()
+                 for year in self.frames]
+
+        self.df = pd.concat(years, ignore_index=True)
+        self.setBounds([len(df) for df in years])
+        self.memory_before = sum(before for _, before in cleaned)
+        self.memory = schema.memoryReport(self.memory_before, schema.memoryUsage(self.df))
+
+        if self.across_years:
+            self.dropRows(dedup.firstOccurrences(dedup.fingerprints(self.df)))
+        tagFrame(self.df, self.version)
+
+        for step in ['deleteDuplicates', 'compactTypes', 'concatenation']:
+            self.views[step] = {year: self.year(year).head() for year in self.bounds}
+
+        return self
+
+    # Persistence
+
+    def save(self, directory='.'):
+        """Write the cleaned frame (parquet) and the bounds, views and memory report next to it, under the version."""
+        path = cleanPath(self.version, directory)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        pd.to_pickle({'bounds': self.bounds, 'views': self.views, 'memory': self.memory,
+                      'memory_before': self.memory_before}, path + '.state.tmp')
+        self.df.to_parquet(path + '.tmp', index=False)
+        os.replace(path + '.state.tmp', path + '.state')
+        os.replace(path + '.tmp', path)  # The parquet file last: it marks the artifact as complete
+        self.path = path
+
+        return path
+
+    @classmethod
+    def load(cls, version, dpt, directory='.'):
+        """Cleaned pipeline of a dataset version saved by save(), None when there is none.
+
+        Only the state (bounds, views, memory report) is read: the cleaned frame is read by rows() on first use.
+        """
+        path = cleanPath(version, directory)
+        if not ingest.HAS_PARQUET or not os.path.exists(path) or not os.path.exists(path + '.state'):
+            return None
+
+        state = pd.read_pickle(path + '.state')
+        pipeline = cls({}, dpt)  # No raw frames: the pipeline only serves its results
+        pipeline.version = version
+        pipeline.frames = dict.fromkeys(state['bounds'])
+        pipeline.bounds = state['bounds']
+        pipeline.views = state['views']
+        pipeline.memory = state['memory']
+        pipeline.memory_before = state['memory_before']
+        pipeline.path = path
+
+        return pipeline
+
+    def rows(self):
+        """The cleaned frame, read from the saved artifact the first time it is needed."""
+        with rows_lock:
+            if self.df is None:
+                self.df = tagFrame(pd.read_parquet(self.path), self.version)
+
+        return self.df
+
+    def year(self, year):
+        start, stop = self.bounds[year]
+
+        return tagFrame(self.rows().iloc[start:stop], '%s:%s' % (self.version, year))
+
+    def years(self):
+        return [self.year(year) for year in self.bounds]
+
+    def setBounds(self, lengths):
+        stops = np.cumsum(lengths)
+        self.bounds = {year: (int(stop - length), int(stop)) for year, length, stop in zip(self.frames, lengths, stops)}
+
+    # Steps
+
+    def chooseCol(self):
+        parts = [frame[ingest.COLS] for frame in self.frames.values()]
+
+        self.df = pd.concat(parts, ignore_index=True)  # The only copy of the data
+        self.setBounds([len(part) for part in parts])
+
+    def modifyTypes(self):
+        self.df['date_mutation'] = pd.to_datetime(self.df['date_mutation'])
+        periods.addPeriods(self.df)  # Integer week / month / quarter keys, computed once for every time series
+        self.df['code_postal'] = codes.normalizePostalCode(self.df['code_postal'])
+        self.df['code_departement'] = codes.normalizeDepartmentCode(self.df['code_departement'])
+
+    def addDepName(self):
+        table = dimensions.dimensionTable(self.dpt)
+
+        self.df["nom_departement"] = table.lookup(self.df["code_departement"], "nom_departement")
+        self.df["nom_region"] = table.lookup(self.df["code_departement"], "nom_region")
+
+    def dropRows(self, keep):
+        self.kept = np.flatnonzero(keep)
+        self.df = self.df.iloc[self.kept].reset_index(drop=True)
+        self.setBounds([int(keep[start:stop].sum()) for start, stop in self.bounds.values()])
+
+    def deleteDuplicates(self):
+        fps = dedup.fingerprints(self.df)
+
+        if self.across_years:
+            keep = dedup.firstOccurrences(fps)
+        else:  # Duplicates within a year
+            keep = np.concatenate([dedup.firstOccurrences(fps[start:stop]) for start, stop in self.bounds.values()])
+
+        self.dropRows(keep)
+
+    def compactTypes(self):
+        self.memory_before = schema.memoryUsage(self.df)
+        schema.compact(self.df)
+        self.memory = schema.memoryReport(self.memory_before, schema.memoryUsage(self.df))
+
+    def concatenation(self):
+        pass  # Years already share one frame
@@ -0,0 +1,138 @@
+# Importations & Settings
+
+import argparse
+import json
+import os
+import time
+
+import pandas as pd
+
+import chartcases
+import cube
+import dimensions
+import geometry
+import ingest
+import lazyclean
+import runner
+import sortedindex
+import spatial
+import tiles
+from pipeline import CleaningPipeline, cleanPath, frameKey, pipelineVersion, tagFrame
+from registry import DatasetRegistry
+
+
+# %% Cleaned dataset
+
+def cleanYears(directory, versions, dpt, workers=1):
+    """Cleaned pipeline of the given {year: version}, read from its artifact when it was precomputed.
+
+    Otherwise the years are loaded and cleaned, and the result is saved for the next start.
+    """
+    version = pipelineVersion(list(versions.values()), dpt)
+
+    pipeline = CleaningPipeline.load(version, dpt, directory)
+    if pipeline is not None:
+        return pipeline
+
+    registry = DatasetRegistry(directory)
+    if lazyclean.enabled():  # One lazy query over the parquet copies of the years
+        pipeline = lazyclean.cleanYears({year: ingest.ingest(registry.urls[year]) for year in versions}, dpt, versions)
+    else:
+        frames = registry.load(list(versions), versions)
+        pipeline = CleaningPipeline(frames, dpt, workers).run()  # One owned frame for all years, cleaned in place
+
+    if ingest.HAS_PARQUET:
+        pipeline.save(directory)
+
+    return pipeline
+
+
+# %% Artifacts
+
+def manifestPath(version, directory='.'):
+    return os.path.join(directory, ingest.CACHE_DIR, 'artifacts-%s.json' % version)
+
+
+def precompute(directory, years, workers=1):
+    """Build every artifact the app reads for a selection of years and return their manifest."""
+    import st_valeurs_foncieres as app  # Chart helpers, called without their Streamlit cache
+
+    steps = []
+
+    def record(name, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        steps.append({'name': name, 'seconds': round(time.perf_counter() - start, 4)})
+        print('%-48s %9.3f s' % (name, steps[-1]['seconds']), flush=True)
+
+        return result
+
+    registry = DatasetRegistry(directory)
+    versions = registry.versions(years)
+    dpt = pd.read_csv(os.path.join(directory, dimensions.DEPARTMENTS_CSV), sep=',', low_memory=False)
+
+    # Ingest, cleaning and the structures built on the cleaned frame
+    if ingest.HAS_PARQUET:
+        for year in years:
+            record('ingest %s' % year, ingest.ingest, registry.urls[year])
+    pipeline = record('cleanYears', cleanYears, directory, versions, dpt, workers)
+    df = pipeline.rows()
+
+    cubes = record('storeCube', cube.storeCube, pipeline.rows, dpt, pipeline.version, directory)  # Whatever the engine
+    for name, rollup in cubes.items():
+        tagFrame(rollup, 'cube:%s:%s' % (name, pipeline.version))
+    df_tiles = record('loadTiles', tiles.loadTiles, pipeline.rows, pipeline.version, directory)
+    tagFrame(df_tiles, 'tiles:' + pipeline.version)
+    index = record('SpatialIndex', spatial.SpatialIndex, df)
+    record('SortedIndex', sortedindex.SortedIndex, df, 'valeur_fonciere')
+
+    artifacts = [cleanPath(pipeline.version, directory), tiles.tilesPath(pipeline.version, directory)]
+    artifacts += [cube.cubePath(pipeline.version, name, directory) for name in cube.ROLLUPS]
+
+    # Simplified geometry variants
+    for url in [geometry.DEPARTMENTS_GEOJSON, geometry.COMMUNES_GEOJSON]:
+        path = os.path.join(directory, url)
+        if os.path.exists(path):
+            store = geometry.GeometryStore(path, directory)
+            for level in geometry.LEVELS:
+                record('geometry %s %s' % (ingest.fileStem(url), level), store.arrays, level)
+                artifacts.append(geometry.variantPath(path, level, directory))
+
+    # Chart helpers, a check that every chart can be drawn from the artifacts
+    for name, args in chartcases.chartCases(df, cubes, df_tiles, index, directory).items():
+        function = getattr(app, name)
+        record(name, getattr(function, '__wrapped__', function), *args)
+
+    manifest = {'version': pipeline.version,
+                'years': versions,
+                'departments': frameKey(dpt),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'artifacts': {os.path.basename(path): os.path.getsize(path) for path in artifacts
+                              if os.path.exists(path)},
+                'steps': steps}
+
+    path = manifestPath(pipeline.version, directory)
+    with open(path, 'w') as file:
+        json.dump(manifest, file, indent=2)
+
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build the artifacts of the app offline: ingested years, cleaned '
+                                                 'dataset, cube, map tiles and simplified geometries.')
+    parser.add_argument('years', nargs='*', help='Years to clean together (default: the last two, as in the app)')
+    parser.add_argument('--directory', default='.', help='Directory of the full_<year>.csv files')
+    parser.add_argument('--workers', type=int, default=runner.WORKERS)
+    args = parser.parse_args()
+
+    available = DatasetRegistry(args.directory).years
+    if not available:
+        raise SystemExit('No full_<year>.csv file found in %s.' % args.directory)
+
+    missing = sorted(set(args.years) - set(available))
+    if missing:
+        raise SystemExit('No file for year(s): %s' % ', '.join(missing))
+
+    manifest = precompute(args.directory, sorted(args.years) or available[-2:], args.workers)
+    print('Version %s: %d artifacts' % (manifest['version'], len(manifest['artifacts'])))
@@ -0,0 +1,48 @@
+# Importations & Settings
+
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import ingest
+from pipeline import tagFrame
+
+
+# %% Dataset Registry
+
+class DatasetRegistry:
+    """Discovers the yearly DVF dumps (full_<year>.csv) of a directory and loads the requested years on demand.
+
+    Nothing is read at discovery time. Years are loaded in parallel threads: parsing and parquet reads release the
+    GIL, and each year is ingested independently.
+    """
+
+    PATTERN = re.compile(r'^full_(\d{4})\.csv$')
+
+    def __init__(self, directory='.'):
+        self.directory = directory
+        self.urls = {}
+
+        for name in sorted(os.listdir(directory)):
+            match = self.PATTERN.match(name)
+            if match:
+                self.urls[match.group(1)] = os.path.join(directory, name)
+
+    @property
+    def years(self):
+        return list(self.urls)
+
+    def versions(self, years):
+        return {year: ingest.sourceKey(self.urls[year]) for year in years}
+
+    def loadYear(self, year, version=None):
+        df = ingest.readColumns(self.urls[year])
+        return tagFrame(df, version or ingest.sourceKey(self.urls[year]))
+
+    def load(self, years, versions=None):
+        versions = versions or self.versions(years)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(len(years), os.cpu_count() or 1))) as executor:
+            frames = executor.map(lambda year: self.loadYear(year, versions[year]), years)
+
+        return dict(zip(years, frames))
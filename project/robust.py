@@ -0,0 +1,87 @@
+# Importations & Settings
+
+import numpy as np
+import pandas as pd
+
+import sortedindex
+
+# Statistics per group, by label in the app
+STATISTICS = {'Mean': 'mean', 'Median': 'median', 'Trimmed mean': 'trimmed_mean'}
+TRIM = 0.1  # Share of the values cut at each end by the trimmed mean
+QUANTILES = [0.25, 0.75]
+
+# DVF has one row per lot and repeats the total value of the sale on each of them. A sale is identified by its
+# id_mutation and disposition
+MUTATION_KEY = ['id_mutation', 'numero_disposition']
+
+
+# %% Mutations
+
+def mutations(df, key=MUTATION_KEY):
+    """One row per sale: its first row, with the built surface of all its rows summed (null when none is known)."""
+    ids, _ = pd.factorize(pd.util.hash_pandas_object(df[key], index=False).to_numpy())
+    first = np.flatnonzero(~pd.Series(ids).duplicated().to_numpy())
+
+    surface = df['surface_reelle_bati'].to_numpy('float64', na_value=np.nan)
+    known = ~np.isnan(surface)
+    total = np.bincount(ids, weights=np.where(known, surface, 0))
+    counted = np.bincount(ids, weights=known)
+
+    # ids count up from 0 in order of first occurrence, so the totals line up with the first rows
+    return df.iloc[first].assign(surface_reelle_bati=np.where(counted > 0, total, np.nan))
+
+
+# %% Group statistics
+
+def groupStats(keys, values, trim=TRIM, quantiles=QUANTILES):
+    """Count, mean, trimmed mean, median and quantiles of values per key, for all groups from one sort.
+
+    Values are sorted within their group once (a lexsort on group and value). Each group is then a slice of the
+    sorted array: sums come from one cumulative sum, medians and quantiles from positions in the slices (linear
+    interpolation, as pandas' quantile). Null keys and values are left out.
+    """
+    keys = pd.Series(keys)
+    values = np.asarray(values, dtype='float64')  # Float32 columns included
+
+    valid = keys.notna().to_numpy() & ~np.isnan(values)
+    codes, uniques = pd.factorize(keys[valid], sort=True)
+    values = values[valid]
+
+    order = np.lexsort((values, codes))
+    values = values[order]
+
+    counts = np.bincount(codes, minlength=len(uniques))
+    starts = np.cumsum(counts) - counts
+    sums = np.append(0, np.cumsum(values))
+
+    def total(start, stop):
+        return sums[stop] - sums[start]
+
+    def quantile(q):
+        position = (counts - 1) * q
+        low = np.floor(position).astype('int64')
+        high = np.minimum(low + 1, counts - 1)
+        fraction = position - low
+
+        return values[starts + low] * (1 - fraction) + values[starts + high] * fraction
+
+    cut = np.floor(counts * trim).astype('int64')
+
+    stats = {'count': counts,
+             'mean': total(starts, starts + counts) / counts,
+             'trimmed_mean': total(starts + cut, starts + counts - cut) / (counts - 2 * cut),
+             'median': quantile(0.5)}
+    stats.update({'q%d' % round(100 * q): quantile(q) for q in quantiles})
+
+    return pd.DataFrame(stats, index=pd.Index(uniques, name=keys.name))
+
+
+def valueM2Stats(df, keys, per_mutation=False):
+    """Statistics of the value / m² of the rows of df per key (a column or a Series aligned on df)."""
+    keys = df[keys] if isinstance(keys, str) else keys
+
+    if per_mutation:
+        df = mutations(df)
+        keys = keys.loc[df.index]
+
+    return groupStats(keys, sortedindex.valueM2(df))
@@ -0,0 +1,41 @@
+# Importations & Settings
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+WORKERS = int(os.environ.get('DVF_WORKERS', os.cpu_count() or 1))
+
+
+# %% Partitioning
+
+def hashPartitions(keys, n):
+    """Split row positions into n groups so that rows with the same key always land in the same group."""
+    if n <= 1:
+        return [np.arange(len(keys))]
+
+    buckets = pd.util.hash_array(np.asarray(keys, dtype=object)) % n
+
+    return [np.flatnonzero(buckets == bucket) for bucket in range(n)]
+
+
+# %% Execution
+
+def mapPartitions(function, partitions, *args, workers=WORKERS):
+    """Call function(partition, *args) for every partition, in worker processes when workers > 1.
+
+    Results are returned in the order of the partitions. Workers are spawned rather than forked, the app runs threads
+    that a fork would copy in an undefined state.
+    """
+    if workers <= 1 or len(partitions) <= 1:
+        return [function(partition, *args) for partition in partitions]
+
+    context = multiprocessing.get_context('spawn')
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(partitions)), mp_context=context) as executor:
+        futures = [executor.submit(function, partition, *args) for partition in partitions]
+
+        return [future.result() for future in futures]
@@ -0,0 +1,97 @@
+# Importations & Settings
+
+import numpy as np
+import pandas as pd
+
+
+# %% Compact schema
+
+# Strings with few distinct values become categoricals, counts the smallest nullable integer holding their range and
+# measures float32 (sums and means are computed in float64 by the cube).
+SCHEMA = {'id_mutation': 'category',  # About two rows per sale
+          'numero_disposition': 'int',
+          'nature_mutation': 'category',
+          'valeur_fonciere': 'float32',
+          'code_postal': 'category',
+          'nom_commune': 'category',
+          'code_departement': 'category',
+          'nombre_lots': 'int',
+          'type_local': 'category',
+          'surface_reelle_bati': 'float32',
+          'nombre_pieces_principales': 'int',
+          'surface_terrain': 'float32',
+          'longitude': 'float32',
+          'latitude': 'float32',
+          'nom_departement': 'category',
+          'nom_region': 'category'}
+
+SAMPLE_SIZE = 100000
+
+
+def smallestInt(series):
+    """Smallest nullable integer dtype holding the values, None when some values are not integers."""
+    values = series.dropna()
+
+    if not (values % 1 == 0).all():
+        return None
+
+    for dtype in ['Int8', 'Int16', 'Int32', 'Int64']:
+        info = np.iinfo(dtype.lower())
+        if values.empty or (info.min <= values.min() and values.max() <= info.max):
+            return dtype
+
+
+def compactColumn(series, kind):
+    if kind == 'category':
+        return series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype('category')
+
+    if kind == 'int':
+        dtype = smallestInt(series)
+        return series.astype(dtype) if dtype else series.astype('float32')
+
+    return series.astype(kind)
+
+
+def compact(df, schema=SCHEMA):
+    """Downcast the columns of df in place, following the schema."""
+    for col, kind in schema.items():
+        if col in df.columns:
+            df[col] = compactColumn(df[col], kind)
+
+    return df
+
+
+def unionCategories(frames):
+    """Give the categorical columns of the frames the same categories so that pd.concat keeps them categorical."""
+    columns = [col for col, dtype in frames[0].dtypes.items() if isinstance(dtype, pd.CategoricalDtype)]
+
+    for col in columns:
+        categories = pd.api.types.union_categoricals([df[col] for df in frames], ignore_order=True).categories
+        categories = categories.sort_values()
+
+        for df in frames:
+            df[col] = df[col].cat.set_categories(categories)
+
+    return frames
+
+
+# %% Memory report
+
+def memoryUsage(df, sample=SAMPLE_SIZE):
+    """Bytes per column. Object columns are measured on a sample, measuring every Python string is too slow."""
+    usage = df.memory_usage(index=False)
+
+    for col in df.columns[df.dtypes == object]:
+        part = df[col].iloc[:sample]
+        usage[col] = part.memory_usage(index=False, deep=True) * len(df) / max(len(part), 1)
+
+    return usage
+
+
+def memoryReport(before, after):
+    report = pd.DataFrame({'Before (MB)': before / 2 ** 20, 'After (MB)': after.reindex(before.index) / 2 ** 20})
+    report['Saved (%)'] = 100 * (1 - report['After (MB)'] / report['Before (MB)'])
+    report.loc['Total'] = [report['Before (MB)'].sum(), report['After (MB)'].sum(),
+                           100 * (1 - report['After (MB)'].sum() / report['Before (MB)'].sum())]
+
+    return report.round(2)
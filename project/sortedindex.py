@@ -0,0 +1,51 @@
+# Importations & Settings
+
+import numpy as np
+
+from pipeline import frameKey, tagFrame
+
+
+# %% Sorted index
+
+def valueM2(df):
+    """Property value / m², null where the built surface is missing or zero."""
+    surface = df['surface_reelle_bati'].astype('float64')
+
+    return (df['valeur_fonciere'].astype('float64') / surface).where(surface > 0)
+
+
+class SortedIndex:
+    """Rows of a frame ordered once by a numeric key, so a value range is a binary search and a slice.
+
+    The key is a column name or a function of the frame (e.g. valueM2). Rows with a null key are left out, they never
+    fall in a range. `between` returns a positional slice of the sorted frame: a view, nothing is scanned or copied.
+    """
+
+    def __init__(self, df, key):
+        values = (df[key] if isinstance(key, str) else key(df)).to_numpy('float64', na_value=np.nan)
+        order = np.argsort(values, kind='stable')  # Nulls sort last
+        order = order[:np.count_nonzero(~np.isnan(values))]
+
+        self.name = key if isinstance(key, str) else key.__name__
+        self.values = values[order]
+        self.df = tagFrame(df.iloc[order], '%s:sorted:%s' % (frameKey(df), self.name))
+
+    def __len__(self):
+        return len(self.values)
+
+    def bounds(self, low=None, high=None):
+        """Positions [start, stop) of the rows with low <= key <= high, a missing bound is open."""
+        start = 0 if low is None else np.searchsorted(self.values, low, side='left')
+        stop = len(self.values) if high is None else np.searchsorted(self.values, high, side='right')
+
+        return int(start), int(max(start, stop))
+
+    def count(self, low=None, high=None):
+        start, stop = self.bounds(low, high)
+
+        return stop - start
+
+    def between(self, low=None, high=None):
+        start, stop = self.bounds(low, high)
+
+        return tagFrame(self.df.iloc[start:stop], '%s:%s:%s' % (self.df.attrs['version'], low, high))
@@ -0,0 +1,117 @@
+# Importations & Settings
+
+import numpy as np
+
+
+# %% Distances
+
+EARTH_RADIUS = 6371008.8  # Meters
+METERS_PER_DEGREE = np.pi * EARTH_RADIUS / 180  # Along a meridian
+CELL_DEGREES = 0.01  # About 1.1 km of latitude, 0.7 km of longitude in France
+
+
+def haversine(latitude, longitude, latitudes, longitudes):
+    """Great-circle distance in meters between one point and arrays of points."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (latitude, longitude, latitudes, longitudes))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+
+# %% Grid index
+
+class SpatialIndex:
+    """Geolocated rows of a frame bucketed in a regular latitude / longitude grid.
+
+    Rows are sorted by cell, cells by row of latitude then longitude, so the cells of a bounding box are one contiguous
+    slice per row of latitude. Queries only compute distances for the rows of the cells they overlap.
+    """
+
+    def __init__(self, df, cell=CELL_DEGREES):
+        latitude = df['latitude'].to_numpy('float64', na_value=np.nan)
+        longitude = df['longitude'].to_numpy('float64', na_value=np.nan)
+        rows = np.flatnonzero(~np.isnan(latitude) & ~np.isnan(longitude))
+
+        self.cell = cell
+        self.columns = int(np.ceil(360 / cell)) + 1
+        keys = self.cellKey(latitude[rows], longitude[rows])
+        order = np.argsort(keys, kind='stable')
+
+        self.df = df
+        self.keys = keys[order]
+        self.positions = rows[order]
+        self.latitude = latitude[self.positions]
+        self.longitude = longitude[self.positions]
+
+    def __len__(self):
+        return len(self.positions)
+
+    def cellRow(self, latitude):
+        return np.floor((np.asarray(latitude) + 90) / self.cell).astype('int64')
+
+    def cellColumn(self, longitude):
+        return np.clip(np.floor((np.asarray(longitude) + 180) / self.cell).astype('int64'), 0, self.columns - 1)
+
+    def cellKey(self, latitude, longitude):
+        return self.cellRow(latitude) * self.columns + self.cellColumn(longitude)
+
+    def candidates(self, south, west, north, east):
+        """Positions in the sorted arrays of the rows whose cell overlaps the box."""
+        rows = np.arange(self.cellRow(south), self.cellRow(north) + 1) * self.columns
+        starts = np.searchsorted(self.keys, rows + self.cellColumn(west), side='left')
+        stops = np.searchsorted(self.keys, rows + self.cellColumn(east), side='right')
+
+        return np.concatenate([np.arange(start, stop) for start, stop in zip(starts, stops)] or [[]]).astype('int64')
+
+    def rows(self, candidates, distances=None):
+        result = self.df.iloc[self.positions[candidates]]
+
+        if distances is not None:
+            result = result.assign(distance=distances)
+
+        return result
+
+    def bbox(self, south, west, north, east):
+        """Rows inside the box, in the order of the frame."""
+        candidates = self.candidates(south, west, north, east)
+        inside = ((self.latitude[candidates] >= south) & (self.latitude[candidates] <= north)
+                  & (self.longitude[candidates] >= west) & (self.longitude[candidates] <= east))
+        candidates = candidates[inside]
+
+        return self.rows(candidates[np.argsort(self.positions[candidates])])
+
+    def withinRadius(self, latitude, longitude, radius, where=None):
+        """Sorted array positions and distances of the rows at most radius meters away, nearest first."""
+        dlat = radius / METERS_PER_DEGREE
+        dlon = dlat / max(np.cos(np.radians(min(abs(latitude) + dlat, 89.9))), 1e-6)
+        candidates = self.candidates(latitude - dlat, longitude - dlon, latitude + dlat, longitude + dlon)
+
+        if where is not None:
+            candidates = candidates[where(self.rows(candidates)).to_numpy(bool, na_value=False)]
+
+        distances = haversine(latitude, longitude, self.latitude[candidates], self.longitude[candidates])
+        near = distances <= radius
+        order = np.argsort(distances[near], kind='stable')
+
+        return candidates[near][order], distances[near][order]
+
+    def radius(self, latitude, longitude, radius, where=None):
+        """Rows at most radius meters away, nearest first, with a distance column in meters.
+
+        where optionally filters the candidate rows: a function of a frame returning a boolean Series, e.g. a type of
+        premises. It is only evaluated on the rows of the overlapped cells.
+        """
+        return self.rows(*self.withinRadius(latitude, longitude, radius, where))
+
+    def nearest(self, latitude, longitude, k, where=None):
+        """The k nearest rows (among the rows kept by where), with a distance column in meters.
+
+        The search radius starts at one cell and doubles until it holds k rows: the k nearest are then all inside.
+        """
+        radius = self.cell * METERS_PER_DEGREE
+
+        while True:
+            candidates, distances = self.withinRadius(latitude, longitude, radius, where)
+            if len(candidates) >= k or radius > np.pi * EARTH_RADIUS:
+                return self.rows(candidates[:k], distances[:k])
+            radius *= 2
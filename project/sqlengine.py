@@ -0,0 +1,66 @@
+# Importations & Settings
+
+import importlib.util
+import os
+import threading
+
+HAS_DUCKDB = importlib.util.find_spec('duckdb') is not None  # Imported by the first query, not with the app
+
+# 'duckdb' runs the chart roll-ups as SQL over the parquet file of the cleaned rows when duckdb is installed, 'pandas'
+# (the default) queries the persisted cube in memory
+ENGINE = os.environ.get('DVF_ENGINE', 'pandas')
+
+
+# %% Connection
+
+connection = None
+connection_lock = threading.Lock()
+
+
+def cursor():
+    """Cursor of the shared in-memory database, one per query: cursors can be used from several threads at once."""
+    global connection
+
+    with connection_lock:
+        if connection is None:
+            import duckdb
+            connection = duckdb.connect()
+
+    return connection.cursor()
+
+
+def enabled(path):
+    return ENGINE == 'duckdb' and HAS_DUCKDB and path is not None and os.path.exists(path)
+
+
+# %% Roll-ups
+
+def quote(name):
+    return '"%s"' % name.replace('"', '""')
+
+
+def rollup(path, keys, filters, measures):
+    """Group the rows of a parquet file by `keys` and return one row per group, sorted by keys.
+
+    `keys` maps each output key to a SQL expression over the columns, `measures` each output column to a SQL
+    aggregate. `filters` is a list of (expression, values): rows are kept when every expression is in its values.
+    The filters are pushed down to the parquet scan, which skips the row groups that cannot match. Rows with a null
+    key are dropped, as in a pandas groupby.
+    """
+    conditions, parameters = [], [path]
+    for expression, values in filters:
+        if not values:
+            conditions.append('FALSE')
+            continue
+        conditions.append('%s IN (%s)' % (expression, ', '.join('?' * len(values))))
+        parameters.extend(values)
+    conditions.extend('%s IS NOT NULL' % expression for expression in keys.values())
+
+    columns = ['%s AS %s' % (expression, quote(name)) for name, expression in keys.items()]
+    columns += ['%s AS %s' % (expression, quote(name)) for name, expression in measures.items()]
+    groups = ', '.join(str(position + 1) for position in range(len(keys)))
+
+    sql = 'SELECT %s FROM read_parquet(?) WHERE %s GROUP BY %s ORDER BY %s' % (
+        ', '.join(columns), ' AND '.join(conditions), groups, groups)
+
+    return cursor().execute(sql, parameters).df()
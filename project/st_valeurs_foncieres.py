@@ -2,160 +2,201 @@
 
 import streamlit as st
 import pandas as pd
-import copy
-import altair as alt
-import plotly.express as px
-import json
-import time
+import os
+
+import codes
+import cube
+import geometry
+import periods
+import precompute
+import robust
+import runner
+import sortedindex
+import spatial
+import tiles
+import tracing
+from backends import alt, px  # Imported by the first section drawing a chart
+from pipeline import frameKey, tagFrame
+from registry import DatasetRegistry
 
 pd.options.mode.chained_assignment = None  # default='warn'
 
+if hasattr(pd.options.mode, 'copy_on_write'):
+    pd.options.mode.copy_on_write = True  # Column selections are views until written to
+
+# Cached functions are keyed on the dataset version of their frames instead of a hash of millions of rows
+CACHE_TTL = 24 * 3600
+CACHE_ENTRIES = 16
+CACHE_OPTIONS = {'ttl': CACHE_TTL, 'max_entries': CACHE_ENTRIES, 'hash_funcs': {pd.DataFrame: frameKey}}
+ROW_ENTRIES = 2  # Resources holding rows of the dataset: a few hundred MB each
+ROW_OPTIONS = dict(CACHE_OPTIONS, max_entries=ROW_ENTRIES)
+
+PAGE_SIZE = 1000  # Rows of a detail table sent at once
+
 
 # %% Useful Functions
 
-def timeit(method):
-    def timed(*args, **kw):
-        file = open("logs.txt", "a")
+def tracePanel():
+    # Spans of this run so far (the sections) and statistics over the last runs of the process
+    trace = tracing.currentTrace()
+    spans = pd.DataFrame(trace.records() if trace else [])
 
-        start = time.time()
-        result = method(*args, **kw)
-        end = time.time()
+    st.sidebar.markdown('#### Spans of this run')
+    if not spans.empty:
+        spans['name'] = ['  ' * depth + name for depth, name in zip(spans['depth'], spans['name'])]
+        st.sidebar.dataframe(spans.drop(columns=['depth']), hide_index=True)
 
-        file.write('%f Execution time: %2.2f seconds\n' % (end, end - start))
-        file.close()
+    st.sidebar.markdown('#### Last %d runs' % len(tracing.recent))
+    st.sidebar.dataframe(pd.DataFrame(tracing.summary()), hide_index=True)
 
-        return result
 
-    return timed
+def showDetails(key):
+    # Detail tables and code are only computed and sent while the toggle is on
+    return st.toggle('Details', key='details' + key)
 
 
-def createTabs(df1, df2):
-    tab1, tab2 = st.tabs(['2019', '2020'])
+def statisticControls(key):
+    # Mean from the cube, or statistics computed from the rows, optionally one row per sale
+    label = st.radio('Statistic', list(robust.STATISTICS), horizontal=True, key=key + 'Statistic')
+    per_mutation = st.checkbox('One row per sale (lots of a sale merged)', key=key + 'Mutations')
 
-    with tab1:
-        st.dataframe(df1.head())
+    return robust.STATISTICS[label], per_mutation
 
-    with tab2:
-        st.dataframe(df2.head())
 
+def pagedDataframe(df, key):
+    # Only one page of rows is sent to the browser
+    pages = max(1, -(-len(df) // PAGE_SIZE))
+    page = 1
+    if pages > 1:
+        page = st.number_input('Page (%s rows)' % '{:,}'.format(len(df)), 1, pages, 1, key='page' + key)
 
-def createDoubleDfTabs(df1, df1b, df2, df2b):
-    tab1, tab2 = st.tabs(['2019', '2020'])
+    st.dataframe(df.iloc[(page - 1) * PAGE_SIZE:page * PAGE_SIZE])
 
-    with tab1:
-        data1, data2 = st.columns([5, 3])
 
-        with data1:
-            st.dataframe(df1)
+def createTabs(frames):
+    tabs = st.tabs(list(frames))
 
-        with data2:
-            st.dataframe(df1b)
+    for tab, df in zip(tabs, frames.values()):
+        with tab:
+            st.dataframe(df.head())
 
-    with tab2:
-        data1, data2 = st.columns([5, 3])
 
-        with data1:
-            st.dataframe(df2)
+def createDoubleDfTabs(frames, key):
+    tabs = st.tabs(list(frames))
 
-        with data2:
-            st.dataframe(df2b)
+    for tab, (year, (df, dfb)) in zip(tabs, frames.items()):
+        with tab:
+            data1, data2 = st.columns([5, 3])
+
+            with data1:
+                pagedDataframe(df, key + year)
+
+            with data2:
+                st.dataframe(dfb)
 
 
 def percentageIncrease(a, b):
     return 100 * (b - a) / a
 
 
-# %% Data Transformation Functions
+def yearsLabel(years):
+    return '/'.join(years) if len(years) <= 2 else '%s-%s' % (years[0], years[-1])
 
-@st.cache(allow_output_mutation=True)
-def loadData(url):
-    return pd.read_csv(url, sep=',', low_memory=False)
 
+def yearMetric(column, label, values, select):
+    # Value of the last year, compared with the year before when there is one
+    years = list(values)
+    current = select(values[years[-1]])
+    label = '%s (%s)' % (label, years[-1])
 
-@st.cache
-def chooseCol(df1, df2):
-    cols = ['numero_disposition', 'date_mutation', 'nature_mutation', 'valeur_fonciere', 'code_postal', 'nom_commune',
-            'code_departement', 'nombre_lots', 'type_local', 'surface_reelle_bati', 'nombre_pieces_principales',
-            'surface_terrain', 'longitude', 'latitude']
+    if current is None or pd.isna(current):
+        column.metric(label, '-')
+        return
 
-    df1_copy = copy.deepcopy(df1[cols])  # I used a deepcopy not to
-    df2_copy = copy.deepcopy(df2[cols])  # mutate last cached outputs
+    delta = None
+    if len(years) > 1:
+        previous = select(values[years[-2]])
+        if previous is not None and not pd.isna(previous):
+            delta = '{:+.0f}% ({})'.format(percentageIncrease(previous, current), years[-2])
 
-    return df1_copy, df2_copy
+    column.metric(label, '{:,} €'.format(int(current)), delta)
 
 
-@st.cache
-def modifyTypes(df1, df2):
-    df1_copy = copy.deepcopy(df1)
-    df2_copy = copy.deepcopy(df2)
+# %% Data Transformation Functions
 
-    df1_copy['date_mutation'] = pd.to_datetime(df1_copy['date_mutation'])
-    df1_copy['code_postal'] = df1_copy['code_postal'].apply(lambda x: str(x)[:-2].zfill(5))
-    df1_copy['code_departement'] = df1_copy['code_departement'].apply(lambda x: str(x).zfill(2))
+@tracing.traced(st.cache_resource(ttl=CACHE_TTL))
+def loadData(url):
+    return pd.read_csv(url, sep=',', low_memory=False)
 
-    df2_copy['date_mutation'] = pd.to_datetime(df2_copy['date_mutation'])
-    df2_copy['code_postal'] = df2_copy['code_postal'].apply(lambda x: str(x)[:-2].zfill(5))
-    df2_copy['code_departement'] = df2_copy['code_departement'].apply(lambda x: str(x).zfill(2))
 
-    return df1_copy, df2_copy
+@tracing.traced(st.cache_resource(ttl=CACHE_TTL))
+def loadGeometry(url):
+    return geometry.GeometryStore(url)  # Simplified variants, decoded once and shared by every rerun
 
 
-@st.cache
-def addDepName(df1, df2, dpt):
-    df1_copy = copy.deepcopy(df1)
-    df2_copy = copy.deepcopy(df2)
+@tracing.traced(st.cache_resource(ttl=CACHE_TTL, max_entries=ROW_ENTRIES))
+def loadYears(directory, versions):
+    return DatasetRegistry(directory).load(list(versions), versions)  # Typed parquet copies, read in parallel
 
-    df1_copy["nom_departement"] = df1_copy["code_departement"].map(dpt.set_index("code_departement")["nom_departement"])
-    df2_copy["nom_departement"] = df2_copy["code_departement"].map(dpt.set_index("code_departement")["nom_departement"])
 
-    return df1_copy, df2_copy
+@tracing.traced(st.cache_resource(**ROW_OPTIONS))
+def cleanData(directory, versions, dpt):
+    # Once precomputed, only the state is read from disk: the rows are read by the first view showing them
+    return precompute.cleanYears(directory, versions, dpt, runner.WORKERS)
 
 
-@st.cache
-def deleteDuplicates(df1, df2):
-    df1_copy = copy.deepcopy(df1).drop_duplicates()
-    df2_copy = copy.deepcopy(df2).drop_duplicates()
+@tracing.traced(st.cache_resource(**CACHE_OPTIONS))
+def aggregateData(version, dpt, _pipeline):
+    cubes = cube.loadCube(_pipeline.rows, dpt, version)  # {name: roll-up of one chart grain}, read from disk
 
-    return df1_copy, df2_copy
+    return {name: tagFrame(rollup, 'cube:%s:%s' % (name, version)) for name, rollup in cubes.items()}
 
 
-@st.cache
-def concatenation(df1, df2):
-    df1_copy = copy.deepcopy(df1)
-    df2_copy = copy.deepcopy(df2)
+# %% Visualization Functions
 
-    return pd.concat([df1_copy, df2_copy])
+MAP_AREAS = {'Paris and its inner suburbs': (['75', '92', '93', '94'], 10),
+             'France': (None, 6)}  # Departments, default zoom
 
 
-# %% Visualization Functions
+@tracing.traced(st.cache_resource(**CACHE_OPTIONS))
+def aggregateTiles(version, _pipeline):
+    df_tiles = tiles.loadTiles(_pipeline.rows, version)
 
-@st.cache
-def dfMaisonMap(df):
-    departments = ['75', '92', '93', '94']
+    return tagFrame(df_tiles, 'tiles:' + version)
 
-    df_maison = df[df['code_departement'].isin(departments)]
-    df_maison = df_maison[df_maison["type_local"] == "Maison"]
 
-    df_maison_loc = df_maison[['latitude', 'longitude']].dropna()
+@tracing.traced(st.cache_data(**CACHE_OPTIONS))
+def dfMaisonMap(df_tiles, area, zoom, min_value):
+    departments, _ = MAP_AREAS[area]
 
-    return df_maison, df_maison_loc
+    return tiles.queryTiles(df_tiles, zoom, min_value, departments)
 
 
-def maisonMap(df):
-    # Dataframes
-    df_maison, df_maison_loc = dfMaisonMap(df)
+@tracing.traced(st.cache_resource(**ROW_OPTIONS))  # Returns row-level frames, shared read-only
+def dfMaisonMapRows(df, area):
+    departments, _ = MAP_AREAS[area]
+
+    df_maison = df if departments is None else df[df['code_departement'].isin(departments)]
+    df_maison = df_maison[df_maison["type_local"] == "Maison"]
 
+    return sortedindex.SortedIndex(df_maison, 'valeur_fonciere')  # Sorted once, thresholds are binary searches
+
+
+@tracing.traced()
+def maisonMap(df_tiles, pipeline, years):
     # Title
-    st.subheader('Map of houses in Paris and its inner suburbs by value (2019/2020)')
+    st.subheader('Map of houses by value (%s)' % yearsLabel(years))
 
-    # Slider for value
+    # Area, zoom & minimum value
+    area = st.radio('Area', list(MAP_AREAS), horizontal=True)
+    zoom = st.select_slider('Detail level', tiles.ZOOMS, value=MAP_AREAS[area][1], key='zoom' + area)
     df_maison_min = st.slider('Minimum Value', 0, 5000000, step=25000)
 
-    # Update minimum value with slider
-    df_maison_loc = df_maison_loc[df_maison['valeur_fonciere'] >= df_maison_min]
+    # Dataframe: one point per bin of the zoom level, from the precomputed tiles
+    df_maison_bins = dfMaisonMap(df_tiles, area, zoom, df_maison_min)
 
     # Mapping
-    st.map(df_maison_loc)
+    st.map(df_maison_bins, size='size', zoom=zoom)
 
     # Text
     st.write('We can observe that, in the inner suburbs of Paris, most of the houses are located in the 93 and 94 ('
@@ -165,60 +206,154 @@ def maisonMap(df):
              'Boulogne-Billancourt.')
 
     # Dataframe & Code
-    maisonLocCode = '''def dfMaisonMap(df):
-    departments = ['75', '92', '93', '94']
+    maisonLocCode = '''def queryTiles(df_tiles, zoom, min_value=0, departments=None):
+    cells = df_tiles[(df_tiles['zoom'] == zoom) & (df_tiles['bucket'] >= min_value // VALUE_STEP)]
 
-    df_maison = df[df['code_departement'].isin(departments)]
-    df_maison = df_maison[df_maison["type_local"] == "Maison"]
+    if departments is not None:
+        cells = cells[cells['code_departement'].isin(departments)]
 
-    df_maison_loc = df_maison[['latitude', 'longitude']].dropna()
+    bins = cells.groupby(['x', 'y'])[['count', 'value', 'latitude', 'longitude']].sum()
+    bins['latitude'] /= bins['count']
+    bins['longitude'] /= bins['count']
+    bins['value'] /= bins['count']
 
-    return df_maison, df_maison_loc
+    # Radius in meters: half a cell for the densest bin, smaller for the others
+    bins['size'] = cellSize(zoom, bins['latitude']) / 2 * np.sqrt(bins['count'] / max(bins['count'].max(), 1))
 
-# Dataframes
-df_maison, df_maison_loc = dfMaisonMap(df)
+    return bins.reset_index(drop=True)
+
+def dfMaisonMap(df_tiles, area, zoom, min_value):
+    departments, _ = MAP_AREAS[area]
 
-# Slider for value
+    return tiles.queryTiles(df_tiles, zoom, min_value, departments)
+
+# Area, zoom & minimum value
+area = st.radio('Area', list(MAP_AREAS), horizontal=True)
+zoom = st.select_slider('Detail level', tiles.ZOOMS, value=MAP_AREAS[area][1], key='zoom' + area)
 df_maison_min = st.slider('Minimum Value', 0, 5000000, step=25000)
 
-# Update minimum value with slider
-df_maison_loc = df_maison_loc[df_maison['valeur_fonciere'] >= df_maison_min]
+# Dataframe: one point per bin of the zoom level, from the precomputed tiles
+df_maison_bins = dfMaisonMap(df_tiles, area, zoom, df_maison_min)
 
 # Mapping
-st.map(df_maison_loc)'''
+st.map(df_maison_bins, size='size', zoom=zoom)'''
 
-    with st.expander("Details"):
-        st.dataframe(df_maison)
+    if showDetails('maisonMap'):
+        pagedDataframe(dfMaisonMapRows(pipeline.rows(), area).between(df_maison_min), 'maisonMap')
         st.code(maisonLocCode, 'python')
 
 
-@st.cache(allow_output_mutation=True)
-def dfMaisonBar(df):
+@tracing.traced(st.cache_resource(**ROW_OPTIONS))
+def indexLocations(df):
+    return spatial.SpatialIndex(df)  # Built once per dataset version, queried on every rerun
+
+
+PLACES = {'Paris, Notre-Dame': (48.8530, 2.3499),
+          'Versailles, Château': (48.8049, 2.1204),
+          'Lyon, Place Bellecour': (45.7578, 4.8320),
+          'Marseille, Vieux-Port': (43.2951, 5.3745),
+          'Bordeaux, Place de la Bourse': (44.8412, -0.5700)}
+
+
+@tracing.traced()
+def dfComparableSales(index, place, type_local, surface, k):
+    latitude, longitude = PLACES[place]
+
+    def comparable(rows):
+        return (rows['type_local'] == type_local) & rows['surface_reelle_bati'].between(0.8 * surface, 1.2 * surface)
+
+    df_comparable = index.nearest(latitude, longitude, k, comparable)
+    df_comparable["Property value / m²"] = sortedindex.valueM2(df_comparable)
+
+    return df_comparable
+
+
+@tracing.traced()
+def comparableSales(index, years):
+    # Title
+    st.subheader('Comparable sales around a place (%s)' % yearsLabel(years))
+
+    # Place, type of premises, surface & number of sales
+    col1, col2 = st.columns(2)
+    place = col1.selectbox('Place', list(PLACES))
+    type_local = col2.radio('Type of premises', ['Appartement', 'Maison'], horizontal=True)
+    surface = col1.number_input('Surface (m²)', 10, 500, 60, step=5)
+    k = col2.slider('Number of sales', 5, 100, 20)
+
+    # Dataframe: nearest sales of the same type with a surface within 20%
+    df_comparable = dfComparableSales(index, place, type_local, surface, k)
+
+    # Mapping
+    st.map(df_comparable, zoom=12)
+
+    # Metrics
+    col1, col2, col3 = st.columns(3)
+    value_m2 = df_comparable["Property value / m²"].median()
+    col1.metric("Median value / m²", '-' if pd.isna(value_m2) else '{:,} €'.format(int(value_m2)))
+    col2.metric("Estimated value", '-' if pd.isna(value_m2) else '{:,} €'.format(int(value_m2 * surface)))
+    distance = df_comparable['distance'].max() / 1000
+    col3.metric("Farthest sale", '-' if pd.isna(distance) else '{:.1f} km'.format(distance))
+
+    # Dataframe & Code
+    comparableCode = '''def dfComparableSales(index, place, type_local, surface, k):
+    latitude, longitude = PLACES[place]
+
+    def comparable(rows):
+        return (rows['type_local'] == type_local) & rows['surface_reelle_bati'].between(0.8 * surface, 1.2 * surface)
+
+    df_comparable = index.nearest(latitude, longitude, k, comparable)
+    df_comparable["Property value / m²"] = sortedindex.valueM2(df_comparable)
+
+    return df_comparable
+
+# Dataframe: nearest sales of the same type with a surface within 20%
+df_comparable = dfComparableSales(index, place, type_local, surface, k)
+
+# Mapping
+st.map(df_comparable, zoom=12)'''
+
+    if showDetails('comparableSales'):
+        st.dataframe(df_comparable)
+        st.code(comparableCode, 'python')
+
+
+@tracing.traced(st.cache_data(**CACHE_OPTIONS))
+def dfMaisonBar(df_cube, year):
     departments = ['77', '78', '91', '92', '93', '94', '95']
 
-    df_maison = df[df['code_departement'].isin(departments)]
-    df_maison.rename(columns={"nom_departement": "Department",
-                              "valeur_fonciere": "Property Value"}, inplace=True)
-    df_maison = df_maison[df_maison["type_local"] == "Maison"]
+    maison = cube.query(df_cube, 'nom_departement', year=year, type_local='Maison', code_departement=departments)
 
-    val_maison_by_dep = df_maison.groupby('Department')['Property Value'].mean()
-    val_maison_by_dep = val_maison_by_dep.sort_values()
+    val_maison_by_dep = cube.mean(maison, 'value').rename('Property Value').sort_values()
+    val_maison_by_dep.index.name = 'Department'
 
-    return df_maison, val_maison_by_dep
+    return val_maison_by_dep
 
 
-def maisonBar(df1, df2):
+@tracing.traced(st.cache_resource(**ROW_OPTIONS))  # Returns row-level frames, shared read-only
+def dfMaisonBarRows(frames):
+    # {year: rows}, one cache entry for the selection of years
+    departments = ['77', '78', '91', '92', '93', '94', '95']
+
+    rows = {}
+    for year, df in frames.items():
+        df_maison = df[df['code_departement'].isin(departments)]
+        df_maison.rename(columns={"nom_departement": "Department",
+                                  "valeur_fonciere": "Property Value"}, inplace=True)
+        rows[year] = df_maison[df_maison["type_local"] == "Maison"]
+
+    return rows
+
+
+@tracing.traced()
+def maisonBar(df_cube, pipeline, years):
     # Dataframes
-    df19_maison, val_maison_by_dep19 = dfMaisonBar(df1)
-    df20_maison, val_maison_by_dep20 = dfMaisonBar(df2)
+    val_maison_by_dep = {year: dfMaisonBar(df_cube, int(year)) for year in years}
 
     # Title
-    st.subheader('Mean value for houses in the departments of Ile-de-France excluding Paris (2019/2020)')
+    st.subheader('Mean value for houses in the departments of Ile-de-France excluding Paris (%s)' % yearsLabel(years))
 
     # Chart
-    val1 = val_maison_by_dep19.reset_index().assign(Year='2019')
-    val2 = val_maison_by_dep20.reset_index().assign(Year='2020')
-    val = pd.concat([val1, val2])
+    val = pd.concat([val_by_dep.reset_index().assign(Year=year) for year, val_by_dep in val_maison_by_dep.items()])
 
     bars = alt.Chart(val).mark_bar().encode(
         x='Year',
@@ -230,25 +365,10 @@ def maisonBar(df1, df2):
     st.altair_chart(bars)
 
     # Metrics
-    idf_percent = percentageIncrease(val_maison_by_dep19.mean(),
-                                     val_maison_by_dep20.mean())
-    idf = ['{:,} €'.format(int(val_maison_by_dep20.mean())),
-           f"+{'{:.0f}'.format(idf_percent)}% (2019)"]
-
-    val_oise_percent = percentageIncrease(val_maison_by_dep19["Val-d'Oise"],
-                                          val_maison_by_dep20["Val-d'Oise"])
-    val_oise = ['{:,} €'.format(int(val_maison_by_dep20["Val-d'Oise"])),
-                f"+{'{:.0f}'.format(val_oise_percent)}% (2019)"]
-
-    yvelines_percent = percentageIncrease(val_maison_by_dep19["Yvelines"],
-                                          val_maison_by_dep20["Yvelines"])
-    yvelines = ['{:,} €'.format(int(val_maison_by_dep20["Yvelines"])),
-                f"{'{:.0f}'.format(yvelines_percent)}% (2019)"]
-
     col1, col2, col3 = st.columns(3)
-    col1.metric("Ile-de-France (2020)", idf[0], idf[1])
-    col2.metric("Val-d'Oise (2020)", val_oise[0], val_oise[1])
-    col3.metric("Yvelines (2020)", yvelines[0], yvelines[1])
+    yearMetric(col1, "Ile-de-France", val_maison_by_dep, lambda val_by_dep: val_by_dep.mean())
+    yearMetric(col2, "Val-d'Oise", val_maison_by_dep, lambda val_by_dep: val_by_dep.get("Val-d'Oise"))
+    yearMetric(col3, "Yvelines", val_maison_by_dep, lambda val_by_dep: val_by_dep.get("Yvelines"))
 
     # Text
     st.write("The department with the highest average in 2019 is the Hauts-de-Seine at around 1.25 million euros. "
@@ -260,27 +380,21 @@ def maisonBar(df1, df2):
              "excluding Paris, an increase of 63% over the previous year.")
 
     # Dataframes & Code
-    valMaisonCode = '''def dfMaisonBar(df):
+    valMaisonCode = '''def dfMaisonBar(df_cube, year):
     departments = ['77', '78', '91', '92', '93', '94', '95']
 
-    df_maison = df[df['code_departement'].isin(departments)]
-    df_maison.rename(columns={"nom_departement": "Department",
-                              "valeur_fonciere": "Property Value"}, inplace=True)
-    df_maison = df_maison[df_maison["type_local"] == "Maison"]
+    maison = cube.query(df_cube, 'nom_departement', year=year, type_local='Maison', code_departement=departments)
 
-    val_maison_by_dep = df_maison.groupby('Department')['Property Value'].mean()
-    val_maison_by_dep = val_maison_by_dep.sort_values()
+    val_maison_by_dep = cube.mean(maison, 'value').rename('Property Value').sort_values()
+    val_maison_by_dep.index.name = 'Department'
 
-    return df_maison, val_maison_by_dep
+    return val_maison_by_dep
 
 # Dataframes
-df19_maison, val_maison_by_dep19 = dfMaisonBar(df1)
-df20_maison, val_maison_by_dep20 = dfMaisonBar(df2)
-    
+val_maison_by_dep = {year: dfMaisonBar(df_cube, int(year)) for year in years}
+
 # Chart
-val1 = val_maison_by_dep19.reset_index().assign(Year='2019')
-val2 = val_maison_by_dep20.reset_index().assign(Year='2020')
-val = pd.concat([val1, val2])
+val = pd.concat([val_by_dep.reset_index().assign(Year=year) for year, val_by_dep in val_maison_by_dep.items()])
 
 bars = alt.Chart(val).mark_bar().encode(
     x='Year',
@@ -292,69 +406,76 @@ bars = alt.Chart(val).mark_bar().encode(
 st.altair_chart(bars)
 
 # Metrics
-idf_percent = percentageIncrease(val_maison_by_dep19.mean(),
-                                 val_maison_by_dep20.mean())
-idf = ['{:,} €'.format(int(val_maison_by_dep20.mean())),
-       f"+{'{:.0f}'.format(idf_percent)}% (2019)"]
+col1, col2, col3 = st.columns(3)
+yearMetric(col1, "Ile-de-France", val_maison_by_dep, lambda val_by_dep: val_by_dep.mean())
+yearMetric(col2, "Val-d'Oise", val_maison_by_dep, lambda val_by_dep: val_by_dep.get("Val-d'Oise"))
+yearMetric(col3, "Yvelines", val_maison_by_dep, lambda val_by_dep: val_by_dep.get("Yvelines"))'''
 
-val_oise_percent = percentageIncrease(val_maison_by_dep19["Val-d'Oise"],
-                                      val_maison_by_dep20["Val-d'Oise"])
-val_oise = ['{:,} €'.format(int(val_maison_by_dep20["Val-d'Oise"])),
-            f"+{'{:.0f}'.format(val_oise_percent)}% (2019)"]
+    if showDetails('maisonBar'):
+        frames = {year: pipeline.year(year) for year in years}  # Rows read from disk on first use
 
-yvelines_percent = percentageIncrease(val_maison_by_dep19["Yvelines"],
-                                      val_maison_by_dep20["Yvelines"])
-yvelines = ['{:,} €'.format(int(val_maison_by_dep20["Yvelines"])),
-            f"{'{:.0f}'.format(yvelines_percent)}% (2019)"]
+        createDoubleDfTabs({year: (rows, val_maison_by_dep[year]) for year, rows in dfMaisonBarRows(frames).items()},
+                           'maisonBar')
+        st.code(valMaisonCode, 'python')
 
-col1, col2, col3 = st.columns(3)
-col1.metric("Ile-de-France (2020)", idf[0], idf[1])
-col2.metric("Val-d'Oise (2020)", val_oise[0], val_oise[1])
-col3.metric("Yvelines (2020)", yvelines[0], yvelines[1])'''
 
-    with st.expander("Details"):
-        createDoubleDfTabs(df19_maison, val_maison_by_dep19, df20_maison, val_maison_by_dep20)
-        st.code(valMaisonCode, 'python')
+@tracing.traced(st.cache_data(**CACHE_OPTIONS))
+def dfArrondParis(df_cube, year):
+    paris = cube.query(df_cube, 'code_postal', year=year, code_departement='75')
+    paris = paris.groupby(paris.index.astype(str).str[-2:]).sum()  # 75116 also belongs to the 16th
 
+    df_val_by_arrond = cube.mean(paris, 'value_m2').dropna().rename("Property value / m²").sort_values()
+    df_val_by_arrond.index.name = "Arrondissement"
 
-@st.cache(allow_output_mutation=True)
-def dfArrondParis(df):
-    df_val_paris = df[["valeur_fonciere", "surface_reelle_bati", "code_postal", "nom_departement"]]
-    df_val_paris = df_val_paris[df_val_paris["nom_departement"] == "Paris"]
-    df_val_paris["Arrondissement"] = df_val_paris["code_postal"].str[-2:]
-    df_val_paris = df_val_paris[df_val_paris['surface_reelle_bati'] != 0]
-    df_val_paris["Property value / m²"] = df_val_paris["valeur_fonciere"] / df_val_paris["surface_reelle_bati"]
-    df_val_paris = df_val_paris[df_val_paris['Arrondissement'] != "0n"].dropna()
+    return df_val_by_arrond
 
-    df_val_by_arrond = df_val_paris.groupby("Arrondissement")["Property value / m²"].mean().sort_values()
 
-    return df_val_paris, df_val_by_arrond
+@tracing.traced(st.cache_data(**CACHE_OPTIONS))
+def dfArrondParisStats(df, per_mutation):
+    paris = df[df['code_departement'] == '75']
+    arrond = paris['code_postal'].astype(str).str[-2:].where(paris['code_postal'].notna()).rename('Arrondissement')
 
+    return robust.valueM2Stats(paris, arrond, per_mutation)  # Count, mean, trimmed mean, median, quartiles
 
-def m2Paris(df1, df2):
-    # Dataframes
-    df19_val_paris, df19_val_by_arrond = dfArrondParis(df1)
-    df20_val_paris, df20_val_by_arrond = dfArrondParis(df2)
 
-    val19 = df19_val_by_arrond.reset_index().assign(Year='2019')
-    val20 = df20_val_by_arrond.reset_index().assign(Year='2020')
-    val = pd.concat([val19, val20])
+@tracing.traced(st.cache_resource(**ROW_OPTIONS))  # Returns row-level frames, shared read-only
+def dfArrondParisRows(frames):
+    # {year: rows sorted by value / m²}, one cache entry for the selection of years
+    rows = {}
+    for year, df in frames.items():
+        df_val_paris = df[["valeur_fonciere", "surface_reelle_bati", "code_postal", "nom_departement"]]
+        df_val_paris = df_val_paris[df_val_paris["nom_departement"] == "Paris"]
+        df_val_paris["Arrondissement"] = df_val_paris["code_postal"].str[-2:]
+        df_val_paris = df_val_paris[df_val_paris['surface_reelle_bati'] != 0]
+        df_val_paris["Property value / m²"] = df_val_paris["valeur_fonciere"] / df_val_paris["surface_reelle_bati"]
+        df_val_paris = df_val_paris.dropna()  # Missing postal codes are null
+
+        rows[year] = sortedindex.SortedIndex(df_val_paris, "Property value / m²")
+
+    return rows
 
+
+@tracing.traced()
+def m2Paris(df_cube, pipeline, years):
     # Title
-    st.subheader('Average price per square meter per district of Paris (2019/2020)')
+    st.subheader('Price per square meter per district of Paris (%s)' % yearsLabel(years))
 
-    # Checkboxes
-    show2019 = st.checkbox('2019', True, key=11)
-    show2020 = st.checkbox('2020', True, key=22)
+    # Statistic
+    statistic, per_mutation = statisticControls('m2Paris')
 
-    if not (show2019 or show2020):
-        val['Property value / m²'] = 0
+    # Dataframes
+    if statistic == 'mean' and not per_mutation:
+        val_by_arrond = {year: dfArrondParis(df_cube, int(year)) for year in years}  # From the cube
+    else:  # From the rows, read from disk on first use
+        val_by_arrond = {year: dfArrondParisStats(pipeline.year(year), per_mutation)[statistic]
+                         .rename("Property value / m²").sort_values() for year in years}
 
-    elif show2019 and not show2020:
-        val['Property value / m²'] = val['Property value / m²'].where(val['Year'] == '2019', 0)
+    val = pd.concat([val_by_year.reset_index().assign(Year=year) for year, val_by_year in val_by_arrond.items()])
 
-    elif show2020 and not show2019:
-        val['Property value / m²'] = val['Property value / m²'].where(val['Year'] == '2020', 0)
+    # Checkboxes
+    shown = [year for year in years if st.checkbox(year, True, key='m2Paris' + year)]
+
+    val['Property value / m²'] = val['Property value / m²'].where(val['Year'].isin(shown), 0)
 
     # Chart
     bars = alt.Chart(val).mark_bar(opacity=0.7).encode(
@@ -366,66 +487,52 @@ def m2Paris(df1, df2):
     st.altair_chart(bars, use_container_width=True)
 
     # Metrics
-    paris_percent = percentageIncrease(df19_val_by_arrond.mean(),
-                                       df20_val_by_arrond.mean())
-    paris = ['{:,} €'.format(int(df20_val_by_arrond.mean())),
-             f"{'{:.0f}'.format(paris_percent)}% (2019)"]
-
-    district8_percent = percentageIncrease(df19_val_by_arrond["08"],
-                                           df20_val_by_arrond["08"])
-    district8 = ['{:,} €'.format(int(df20_val_by_arrond["08"])),
-                 f"+{'{:.0f}'.format(district8_percent)}% (2019)"]
-
-    district15_percent = percentageIncrease(df19_val_by_arrond["15"],
-                                            df20_val_by_arrond["15"])
-    district15 = ['{:,} €'.format(int(df20_val_by_arrond["15"])),
-                  f"{'{:.0f}'.format(district15_percent)}% (2019)"]
-
     col1, col2, col3 = st.columns(3)
-    col1.metric("Paris (2020)", paris[0], paris[1])
-    col2.metric("8th district (2020)", district8[0], district8[1])
-    col3.metric("15th district (2020)", district15[0], district15[1])
+    yearMetric(col1, "Paris", val_by_arrond, lambda val_by_year: val_by_year.mean())
+    yearMetric(col2, "8th district", val_by_arrond, lambda val_by_year: val_by_year.get("08"))
+    yearMetric(col3, "15th district", val_by_arrond, lambda val_by_year: val_by_year.get("15"))
 
     # Text
     st.write('The districts with the lowest prices are those often considered the most modest, often on the edge of '
              'Paris. In contrast, the apartments with the highest prices are those in the heart of the capital. The '
              '1st and 8th arrondissements are the most affluent with more than 190,000 euros per meter over the two '
              'years. Between 2019 and 2020 the average price of a square meter in Paris fell by 10%. The most '
-             'affected district is the 15th with a price price reduced by almost 90%.')
+             'affected district is the 15th with a price price reduced by almost 90%. These means are driven by sales '
+             'of several lots, whose total value is repeated on every lot: the median, or one row per sale, gives '
+             'the usual prices.')
 
     # Dataframes & Code
-    valArrondCode = '''def dfArrondParis(df):
-    df_val_paris = df[["valeur_fonciere", "surface_reelle_bati", "code_postal", "nom_departement"]]
-    df_val_paris = df_val_paris[df_val_paris["nom_departement"] == "Paris"]
-    df_val_paris["Arrondissement"] = df_val_paris["code_postal"].str[-2:]
-    df_val_paris = df_val_paris[df_val_paris['surface_reelle_bati'] != 0]
-    df_val_paris["Property value / m²"] = df_val_paris["valeur_fonciere"] / df_val_paris["surface_reelle_bati"]
-    df_val_paris = df_val_paris[df_val_paris['Arrondissement'] != "0n"].dropna()
+    valArrondCode = '''def dfArrondParis(df_cube, year):
+    paris = cube.query(df_cube, 'code_postal', year=year, code_departement='75')
+    paris = paris.groupby(paris.index.astype(str).str[-2:]).sum()  # 75116 also belongs to the 16th
+
+    df_val_by_arrond = cube.mean(paris, 'value_m2').dropna().rename("Property value / m²").sort_values()
+    df_val_by_arrond.index.name = "Arrondissement"
+
+    return df_val_by_arrond
 
-    df_val_by_arrond = df_val_paris.groupby("Arrondissement")["Property value / m²"].mean().sort_values()
+def dfArrondParisStats(df, per_mutation):
+    paris = df[df['code_departement'] == '75']
+    arrond = paris['code_postal'].astype(str).str[-2:].where(paris['code_postal'].notna()).rename('Arrondissement')
 
-    return df_val_paris, df_val_by_arrond
+    return robust.valueM2Stats(paris, arrond, per_mutation)  # Count, mean, trimmed mean, median, quartiles
+
+# Statistic
+statistic, per_mutation = statisticControls('m2Paris')
 
 # Dataframes
-df19_val_paris, df19_val_by_arrond = dfArrondParis(df1)
-df20_val_paris, df20_val_by_arrond = dfArrondParis(df2)
+if statistic == 'mean' and not per_mutation:
+    val_by_arrond = {year: dfArrondParis(df_cube, int(year)) for year in years}  # From the cube
+else:  # From the rows, read from disk on first use
+    val_by_arrond = {year: dfArrondParisStats(pipeline.year(year), per_mutation)[statistic]
+                     .rename("Property value / m²").sort_values() for year in years}
 
-val19 = df19_val_by_arrond.reset_index().assign(Year='2019')
-val20 = df20_val_by_arrond.reset_index().assign(Year='2020')
-val = pd.concat([val19, val20])
+val = pd.concat([val_by_year.reset_index().assign(Year=year) for year, val_by_year in val_by_arrond.items()])
     
 # Checkboxes
-show2019 = st.checkbox('2019', True, key=11)
-show2020 = st.checkbox('2020', True, key=22)
-
-if not (show2019 or show2020):
-    val['Property value / m²'] = 0
-
-elif show2019 and not show2020:
-    val['Property value / m²'] = val['Property value / m²'].where(val['Year'] == '2019', 0)
+shown = [year for year in years if st.checkbox(year, True, key='m2Paris' + year)]
 
-elif show2020 and not show2019:
-    val['Property value / m²'] = val['Property value / m²'].where(val['Year'] == '2020', 0)
+val['Property value / m²'] = val['Property value / m²'].where(val['Year'].isin(shown), 0)
 
 # Chart
 bars = alt.Chart(val).mark_bar(opacity=0.7).encode(
@@ -437,52 +544,69 @@ bars = alt.Chart(val).mark_bar(opacity=0.7).encode(
 st.altair_chart(bars, use_container_width=True)
 
 # Metrics
-paris_percent = percentageIncrease(df19_val_by_arrond.mean(),
-                                 df20_val_by_arrond.mean())
-paris = ['{:,} €'.format(int(df20_val_by_arrond.mean())),
-         f"{'{:.0f}'.format(paris_percent)}% (2019)"]
-
-district8_percent = percentageIncrease(df19_val_by_arrond["08"],
-                                      df20_val_by_arrond["08"])
-district8 = ['{:,} €'.format(int(df20_val_by_arrond["08"])),
-             f"+{'{:.0f}'.format(district8_percent)}% (2019)"]
+col1, col2, col3 = st.columns(3)
+yearMetric(col1, "Paris", val_by_arrond, lambda val_by_year: val_by_year.mean())
+yearMetric(col2, "8th district", val_by_arrond, lambda val_by_year: val_by_year.get("08"))
+yearMetric(col3, "15th district", val_by_arrond, lambda val_by_year: val_by_year.get("15"))'''
 
-district15_percent = percentageIncrease(df19_val_by_arrond["15"],
-                                      df20_val_by_arrond["15"])
-district15 = ['{:,} €'.format(int(df20_val_by_arrond["15"])),
-              f"{'{:.0f}'.format(district15_percent)}% (2019)"]
+    if showDetails('m2Paris'):
+        low, high = st.slider('Property value / m² range', 0, 50000, (0, 50000), step=500, key='m2ParisRange')
+        high = None if high == 50000 else high  # The last step includes every higher value
 
-col1, col2, col3 = st.columns(3)
-col1.metric("Paris (2020)", paris[0], paris[1])
-col2.metric("8th district (2020)", district8[0], district8[1])
-col3.metric("15th district (2020)", district15[0], district15[1])'''
+        frames = {year: pipeline.year(year) for year in years}
 
-    with st.expander("Details"):
-        createDoubleDfTabs(df19_val_paris, df19_val_by_arrond, df20_val_paris, df20_val_by_arrond)
+        createDoubleDfTabs({year: (rows.between(low, high), val_by_arrond[year])
+                            for year, rows in dfArrondParisRows(frames).items()}, 'm2Paris')
         st.code(valArrondCode, 'python')
 
 
-@st.cache
-def dfAppartVersailles(df):
+@tracing.traced(st.cache_data(**CACHE_OPTIONS))
+def dfAppartVersailles(df_cube, period):
+    versailles = cube.query(df_cube, period, nom_commune='Versailles', type_local='Appartement')
+
+    appart_by_month = cube.mean(versailles, 'value_m2').rename('Property value / m²')
+    appart_by_month.index = pd.Index([periods.periodLabel(key, period) for key in appart_by_month.index],
+                                     name=period.capitalize())
+
+    return appart_by_month
+
+
+@tracing.traced(st.cache_data(**CACHE_OPTIONS))
+def dfAppartVersaillesStats(df, period, per_mutation):
+    versailles = df[(df['nom_commune'] == 'Versailles') & (df['type_local'] == 'Appartement')]
+
+    stats = robust.valueM2Stats(versailles, period, per_mutation)
+    stats.index = pd.Index([periods.periodLabel(key, period) for key in stats.index], name=period.capitalize())
+
+    return stats
+
+
+@tracing.traced(st.cache_resource(**ROW_OPTIONS))  # Returns row-level frames, shared read-only
+def dfAppartVersaillesRows(df):
     appart_versailles = df[["date_mutation", "valeur_fonciere",
                             "surface_reelle_bati", "type_local", "nom_commune"]]
     appart_versailles = appart_versailles[appart_versailles["nom_commune"] == "Versailles"]
     appart_versailles = appart_versailles[appart_versailles["type_local"] == "Appartement"]
     appart_versailles["Property value / m²"] = appart_versailles["valeur_fonciere"] / appart_versailles[
         "surface_reelle_bati"]
-    appart_versailles["Month"] = appart_versailles["date_mutation"].dt.strftime('%Y-%m')
 
-    appart_by_month = appart_versailles.groupby('Month')['Property value / m²'].mean()
+    return appart_versailles
 
-    return appart_versailles, appart_by_month
 
+@tracing.traced()
+def appartVersailles(df_cube, pipeline, years, period):
+    # Title
+    st.subheader('Price per square meter of an apartment in Versailles over the %ss (%s)' % (period, yearsLabel(years)))
 
-def appartVersailles(df):
-    # Dataframes
-    appart_versailles, appart_by_month = dfAppartVersailles(df)
+    # Statistic
+    statistic, per_mutation = statisticControls('appartVersailles')
 
-    # Title
-    st.subheader('Average price per square meter of an apartment in Versailles over the months (2019/2020)')
+    # Dataframes
+    if statistic == 'mean' and not per_mutation:
+        appart_by_month = dfAppartVersailles(df_cube, period)  # From the cube
+    else:
+        appart_by_month = dfAppartVersaillesStats(pipeline.rows(), period, per_mutation)[statistic] \
+            .rename('Property value / m²')  # From the rows, read from disk on first use
 
     # Chart
     st.bar_chart(appart_by_month)
@@ -499,21 +623,32 @@ def appartVersailles(df):
              'more expensive than the others, even reaching around 30,000 euros for the last two.')
 
     # Dataframes & Code
-    appartCode = '''def dfAppartVersailles(df):
-    appart_versailles = df[["date_mutation", "valeur_fonciere",
-                            "surface_reelle_bati", "type_local", "nom_commune"]]
-    appart_versailles = appart_versailles[appart_versailles["nom_commune"] == "Versailles"]
-    appart_versailles = appart_versailles[appart_versailles["type_local"] == "Appartement"]
-    appart_versailles["Property value / m²"] = appart_versailles["valeur_fonciere"] / appart_versailles[
-        "surface_reelle_bati"]
-    appart_versailles["Month"] = appart_versailles["date_mutation"].dt.strftime('%Y-%m')
+    appartCode = '''def dfAppartVersailles(df_cube, period):
+    versailles = cube.query(df_cube, period, nom_commune='Versailles', type_local='Appartement')
 
-    appart_by_month = appart_versailles.groupby('Month')['Property value / m²'].mean()
+    appart_by_month = cube.mean(versailles, 'value_m2').rename('Property value / m²')
+    appart_by_month.index = pd.Index([periods.periodLabel(key, period) for key in appart_by_month.index],
+                                     name=period.capitalize())
+
+    return appart_by_month
+
+def dfAppartVersaillesStats(df, period, per_mutation):
+    versailles = df[(df['nom_commune'] == 'Versailles') & (df['type_local'] == 'Appartement')]
+
+    stats = robust.valueM2Stats(versailles, period, per_mutation)
+    stats.index = pd.Index([periods.periodLabel(key, period) for key in stats.index], name=period.capitalize())
+
+    return stats
+
+# Statistic
+statistic, per_mutation = statisticControls('appartVersailles')
 
-    return appart_versailles, appart_by_month
-    
 # Dataframes
-appart_versailles, appart_by_month = dfAppartVersailles(df)
+if statistic == 'mean' and not per_mutation:
+    appart_by_month = dfAppartVersailles(df_cube, period)  # From the cube
+else:
+    appart_by_month = dfAppartVersaillesStats(pipeline.rows(), period, per_mutation)[statistic] \\
+        .rename('Property value / m²')  # From the rows, read from disk on first use
 
 # Chart
 st.bar_chart(appart_by_month)
@@ -524,11 +659,11 @@ col1.metric("Mean", '{:,.2f}'.format(appart_by_month.mean()))
 col2.metric("Median", '{:,.2f}'.format(appart_by_month.median()))
 col3.metric("Standard Deviation", '{:,.2f}'.format(appart_by_month.std()))'''
 
-    with st.expander("Details"):
+    if showDetails('appartVersailles'):
         data1, data2 = st.columns([5, 3])
 
         with data1:
-            st.dataframe(appart_versailles)
+            pagedDataframe(dfAppartVersaillesRows(pipeline.rows()), 'appartVersailles')
 
         with data2:
             st.dataframe(appart_by_month)
@@ -536,26 +671,28 @@ col3.metric("Standard Deviation", '{:,.2f}'.format(appart_by_month.std()))'''
         st.code(appartCode, 'python')
 
 
-@st.cache
-def dfSalesType(df):
-    type_sales = df[["date_mutation", "type_local"]].dropna()
-    type_sales["Month"] = type_sales["date_mutation"].dt.strftime('%Y-%m')
-    type_sales = type_sales.groupby(['type_local', 'Month']).size().reset_index()
-    type_sales.rename(columns={0: 'Number of sales',
-                               'type_local': 'Local type'}, inplace=True)
+@tracing.traced(st.cache_data(**CACHE_OPTIONS))
+def dfSalesType(df_cube, period):
+    type_sales = cube.query(df_cube, ['type_local', period])['count'].reset_index()
+    type_sales[period] = type_sales[period].map(lambda key: periods.periodLabel(key, period))
+    type_sales.rename(columns={'count': 'Number of sales',
+                               'type_local': 'Local type',
+                               period: period.capitalize()}, inplace=True)
     return type_sales
 
 
-def salesType(df):
+@tracing.traced()
+def salesType(df_cube, years, period):
     # Dataframe
-    type_sales = dfSalesType(df)
+    type_sales = dfSalesType(df_cube, period)
 
     # Title
-    st.subheader('Evolution of the number of sales by type of premises over the months (2019/2020)')
+    st.subheader('Evolution of the number of sales by type of premises over the %ss (%s)'
+                 % (period, yearsLabel(years)))
 
     # Chart
     lines = alt.Chart(type_sales).mark_line(point=True).encode(
-        x='Month',
+        x=period.capitalize(),
         y='Number of sales',
         color='Local type',
     ).interactive()
@@ -574,54 +711,53 @@ def salesType(df):
              'year is close at hand.')
 
     # Dataframes & Code
-    typeSalesCode = '''def dfSalesType(df):
-    type_sales = df[["date_mutation", "type_local"]].dropna()
-    type_sales["Month"] = type_sales["date_mutation"].dt.strftime('%Y-%m')
-    type_sales = type_sales.groupby(['type_local', 'Month']).size().reset_index()
-    type_sales.rename(columns={0: 'Number of sales', 
-                               'type_local': 'Local type'}, inplace=True)
+    typeSalesCode = '''def dfSalesType(df_cube, period):
+    type_sales = cube.query(df_cube, ['type_local', period])['count'].reset_index()
+    type_sales[period] = type_sales[period].map(lambda key: periods.periodLabel(key, period))
+    type_sales.rename(columns={'count': 'Number of sales',
+                               'type_local': 'Local type',
+                               period: period.capitalize()}, inplace=True)
     return type_sales
 
 # Dataframe
-type_sales = dfSalesType(df)
+type_sales = dfSalesType(df_cube, period)
 
 # Chart
 lines = alt.Chart(type_sales).mark_line(point=True).encode(
-    x='Month',
+    x=period.capitalize(),
     y='Number of sales',
     color='Local type',
 ).interactive()
 
 st.altair_chart(lines, use_container_width=True)'''
 
-    with st.expander("Details"):
+    if showDetails('salesType'):
         st.dataframe(type_sales)
         st.code(typeSalesCode, 'python')
 
 
-@st.cache
-def dfSalesRegion(df, dpt):
-    region_sales = df[["date_mutation", "code_departement"]]
-
-    region_sales["Region"] = region_sales["code_departement"].map(dpt.set_index("code_departement")["nom_region"])
-    region_sales["Month"] = region_sales["date_mutation"].dt.strftime('%Y-%m')
-
-    region_sales = region_sales.groupby(['Region', 'Month']).size().reset_index()
-    region_sales.rename(columns={0: 'Number of sales'}, inplace=True)
+@tracing.traced(st.cache_data(**CACHE_OPTIONS))
+def dfSalesRegion(df_cube, period):
+    region_sales = cube.query(df_cube, ['nom_region', period])['count'].reset_index()
+    region_sales[period] = region_sales[period].map(lambda key: periods.periodLabel(key, period))
+    region_sales.rename(columns={'count': 'Number of sales',
+                                 'nom_region': 'Region',
+                                 period: period.capitalize()}, inplace=True)
 
     return region_sales
 
 
-def salesRegion(df, dpt):
+@tracing.traced()
+def salesRegion(df_cube, years, period):
     # Dataframe
-    region_sales = dfSalesRegion(df, dpt)
+    region_sales = dfSalesRegion(df_cube, period)
 
     # Title
-    st.subheader('Heat map of the number of sales by month and by region across 2019 and 2020')
+    st.subheader('Heat map of the number of sales by %s and by region across %s' % (period, yearsLabel(years)))
 
     # Chart
     heatmap = alt.Chart(region_sales).mark_rect().encode(
-        x='Month:O',
+        x=period.capitalize() + ':O',
         y=alt.Y('Region:O', sort='-color'),
         color=alt.Color('Number of sales:Q', scale=alt.Scale(scheme='goldred'))
     )
@@ -639,57 +775,54 @@ def salesRegion(df, dpt):
              'and many people are on vacation.')
 
     # Dataframes & Code
-    regionSalesCode = '''def dfSalesRegion(df, dpt):
-    region_sales = df[["date_mutation", "code_departement"]]
-
-    region_sales["Region"] = region_sales["code_departement"].map(dpt.set_index("code_departement")["nom_region"])
-    region_sales["Month"] = region_sales["date_mutation"].dt.strftime('%Y-%m')
-
-    region_sales = region_sales.groupby(['Region', 'Month']).size().reset_index()
-    region_sales.rename(columns={0: 'Number of sales'}, inplace=True)
+    regionSalesCode = '''def dfSalesRegion(df_cube, period):
+    region_sales = cube.query(df_cube, ['nom_region', period])['count'].reset_index()
+    region_sales[period] = region_sales[period].map(lambda key: periods.periodLabel(key, period))
+    region_sales.rename(columns={'count': 'Number of sales',
+                                 'nom_region': 'Region',
+                                 period: period.capitalize()}, inplace=True)
 
     return region_sales
 
 # Dataframe
-region_sales = dfSalesRegion(df, dpt)
+region_sales = dfSalesRegion(df_cube, period)
 
 # Chart
 heatmap = alt.Chart(region_sales).mark_rect().encode(
-    x='Month:O',
+    x=period.capitalize() + ':O',
     y='Region:O',
     color=alt.Color('Number of sales:Q',scale=alt.Scale(scheme='goldred'))
 )
 
 st.altair_chart(heatmap, use_container_width=True)'''
 
-    with st.expander("Details"):
+    if showDetails('salesRegion'):
         st.dataframe(region_sales)
         st.code(regionSalesCode, 'python')
 
 
-@st.cache
-def dfMostApartments(df1, df2):
-    most_apart1 = df1.groupby(['nom_departement', 'type_local'])['type_local'].count()
-    most_apart1 = most_apart1[:, 'Appartement'].sort_values(ascending=False)[:10].reset_index()
-    most_apart1.rename(columns={"type_local": "2019"}, inplace=True)
+@tracing.traced(st.cache_data(**CACHE_OPTIONS))
+def dfMostApartments(df_cube):
+    apart = cube.query(df_cube, ['nom_departement', 'year'], type_local='Appartement')['count']
 
-    most_apart2 = df2.groupby(['nom_departement', 'type_local'])['type_local'].count()
-    most_apart2 = most_apart2[:, 'Appartement'].sort_values(ascending=False)[:10].reset_index()
-    most_apart2.rename(columns={"type_local": "2020"}, inplace=True)
-
-    most_apart = most_apart1.join(most_apart2['2020'])
+    most_apart = apart.unstack('year', fill_value=0)
+    most_apart.columns = [str(year) for year in most_apart.columns]
     most_apart['Average'] = most_apart.mean(axis=1).astype('int64')
+
+    most_apart = most_apart.sort_values('Average', ascending=False)[:10].reset_index()
     most_apart.rename(columns={"nom_departement": "Department"}, inplace=True)
 
     return most_apart
 
 
-def mostApartments(df1, df2):
+@tracing.traced()
+def mostApartments(df_cube, years):
     # Dataframe
-    most_apart = dfMostApartments(df1, df2)
+    most_apart = dfMostApartments(df_cube)
 
     # Title
-    st.subheader('Distribution of apartments among the 10 departments which have the most (Average for 2019 and 2020)')
+    st.subheader('Distribution of apartments among the 10 departments which have the most (Average for %s)'
+                 % yearsLabel(years))
 
     # Chart
     base = alt.Chart(most_apart).encode(
@@ -710,17 +843,14 @@ def mostApartments(df1, df2):
              'total of the departments of Rhône and Bouches-du-Rhône.')
 
     # Dataframes & Code
-    mostApartCode = '''def dfMostApartments(df1, df2):
-    most_apart1 = df1.groupby(['nom_departement', 'type_local'])['type_local'].count()
-    most_apart1 = most_apart1[:, 'Appartement'].sort_values(ascending=False)[:10].reset_index()
-    most_apart1.rename(columns={"type_local": "2019"}, inplace=True)
-
-    most_apart2 = df2.groupby(['nom_departement', 'type_local'])['type_local'].count()
-    most_apart2 = most_apart2[:, 'Appartement'].sort_values(ascending=False)[:10].reset_index()
-    most_apart2.rename(columns={"type_local": "2020"}, inplace=True)
+    mostApartCode = '''def dfMostApartments(df_cube):
+    apart = cube.query(df_cube, ['nom_departement', 'year'], type_local='Appartement')['count']
 
-    most_apart = most_apart1.join(most_apart2['2020'])
+    most_apart = apart.unstack('year', fill_value=0)
+    most_apart.columns = [str(year) for year in most_apart.columns]
     most_apart['Average'] = most_apart.mean(axis=1).astype('int64')
+
+    most_apart = most_apart.sort_values('Average', ascending=False)[:10].reset_index()
     most_apart.rename(columns={"nom_departement": "Department"}, inplace=True)
 
     return most_apart
@@ -736,35 +866,32 @@ text = base.mark_text(radiusOffset=20).encode(text="Average:Q")
 
 st.altair_chart(pie+text, use_container_width=True)'''
 
-    with st.expander("Details"):
+    if showDetails('mostApartments'):
         st.dataframe(most_apart)
         st.code(mostApartCode, 'python')
 
 
-@st.cache
-def dfSurfaceDep(df):
-    dep_france = json.load(open("departements-version-simplifiee.geojson", "r"))
-    # Source : https://github.com/gregoiredavid/france-geojson/blob/master/departements-version-simplifiee.geojson
-
-    dep_id_map = {}
-    for feature in dep_france["features"]:
-        feature["id"] = feature["properties"]["nom"]
-        dep_id_map[feature["properties"]["code"]] = feature["id"]
+@tracing.traced(st.cache_data(**CACHE_OPTIONS))
+def dfSurfaceDep(df_cube):
+    dep_id_map = loadGeometry(geometry.DEPARTMENTS_GEOJSON).names()
 
-    dep_surface = df[["surface_reelle_bati", "code_departement"]]
-    dep_surface.rename(columns={"surface_reelle_bati": "Real surface"}, inplace=True)
-    dep_surface = dep_surface.groupby("code_departement").mean().reset_index()[:-4]
-    dep_surface["id"] = dep_surface["code_departement"].apply(lambda x: dep_id_map[x])
+    dep_surface = cube.query(df_cube, 'code_departement')
+    dep_surface = cube.mean(dep_surface, 'surface').rename("Real surface").reset_index()
+    dep_surface["id"] = dep_surface["code_departement"].map(dep_id_map)
+    dep_surface = dep_surface.dropna(subset=["id"])  # Departments missing from the map, i.e. overseas
 
-    return dep_surface, dep_france
+    return dep_surface
 
 
-def surfaceDep(df):
-    # Dataframes
-    dep_surface, departments = dfSurfaceDep(df)
+@tracing.traced()
+def surfaceDep(df_cube, years):
+    # Dataframe & geometry (coarse variant: the map shows the whole country)
+    dep_surface = dfSurfaceDep(df_cube)
+    departments = loadGeometry(geometry.DEPARTMENTS_GEOJSON).geojson('coarse')
 
     # Title
-    st.subheader('Choropleth map of the average real surface per department in metropolitan France (2019/2020)')
+    st.subheader('Choropleth map of the average real surface per department in metropolitan France (%s)'
+                 % yearsLabel(years))
 
     # Map
     dep_map = px.choropleth(dep_surface,
@@ -789,24 +916,19 @@ def surfaceDep(df):
              'highest average surface is Ardèche. The one with the lowest is obviously Paris.')
 
     # Dataframes & Code
-    depSurfaceCode = '''def dfSurfaceDep(df):
-    dep_france = json.load(open("departements-version-simplifiee.geojson", "r"))
-    # Source : https://github.com/gregoiredavid/france-geojson/blob/master/departements-version-simplifiee.geojson
+    depSurfaceCode = '''def dfSurfaceDep(df_cube):
+    dep_id_map = loadGeometry(geometry.DEPARTMENTS_GEOJSON).names()
 
-    dep_id_map = {}
-    for feature in dep_france["features"]:
-        feature["id"] = feature["properties"]["nom"]
-        dep_id_map[feature["properties"]["code"]] = feature["id"]
+    dep_surface = cube.query(df_cube, 'code_departement')
+    dep_surface = cube.mean(dep_surface, 'surface').rename("Real surface").reset_index()
+    dep_surface["id"] = dep_surface["code_departement"].map(dep_id_map)
+    dep_surface = dep_surface.dropna(subset=["id"])  # Departments missing from the map, i.e. overseas
 
-    dep_surface = df[["surface_reelle_bati", "code_departement"]]
-    dep_surface.rename(columns={"surface_reelle_bati": "Real surface"}, inplace=True)
-    dep_surface = dep_surface.groupby("code_departement").mean().reset_index()[:-4]
-    dep_surface["id"] = dep_surface["code_departement"].apply(lambda x: dep_id_map[x])
+    return dep_surface
 
-    return dep_surface, dep_france
-
-# Dataframes
-dep_surface, departments = dfSurfaceDep(df)
+# Dataframe & geometry (coarse variant: the map shows the whole country)
+dep_surface = dfSurfaceDep(df_cube)
+departments = loadGeometry(geometry.DEPARTMENTS_GEOJSON).geojson('coarse')
 
 # Map
 dep_map = px.choropleth(dep_surface,
@@ -825,14 +947,102 @@ config = {'displaylogo': False,
 
 st.plotly_chart(dep_map, config=config, use_container_width=True)'''
 
-    with st.expander("Details"):
+    if showDetails('surfaceDep'):
         st.dataframe(dep_surface)
         st.code(depSurfaceCode, 'python')
 
 
+@tracing.traced(st.cache_data(**CACHE_OPTIONS))
+def dfValueCommune(df_cube, department):
+    store = loadGeometry(geometry.COMMUNES_GEOJSON)
+    commune_codes = store.codes(department)
+
+    communes = cube.query(df_cube, 'nom_commune', code_departement=department)
+    communes = communes.groupby(communes.index.map(geometry.nameKey).map(commune_codes)).sum()  # Arrondissements too
+
+    val_by_commune = cube.mean(communes, 'value_m2').rename("Property value / m²").dropna()
+    val_by_commune = val_by_commune.rename_axis('code').reset_index()
+    val_by_commune["Commune"] = val_by_commune["code"].map(store.names())
+    val_by_commune["Sales"] = val_by_commune["code"].map(communes['count'])
+
+    return val_by_commune
+
+
+@tracing.traced()
+def valueCommune(df_cube, years):
+    # Title
+    st.subheader('Average price per square meter per commune (%s)' % yearsLabel(years))
+
+    if not os.path.exists(geometry.COMMUNES_GEOJSON):
+        st.info('Add %s to show this map.' % geometry.COMMUNES_GEOJSON)
+        return
+
+    # Department
+    department = st.selectbox('Department', codes.DEPARTMENTS, index=codes.DEPARTMENTS.index('78'))
+
+    # Dataframe & geometry: only the communes of the department are decoded and sent
+    val_by_commune = dfValueCommune(df_cube, department)
+    communes = loadGeometry(geometry.COMMUNES_GEOJSON).department(department)
+
+    # Map
+    commune_map = px.choropleth(val_by_commune,
+                                locations="code",
+                                geojson=communes,
+                                featureidkey="properties.code",
+                                color="Property value / m²",
+                                hover_name="Commune",
+                                hover_data=["Property value / m²", "Sales"])
+
+    commune_map.update_geos(fitbounds="geojson", visible=False)
+
+    config = {'displaylogo': False,
+              'modeBarButtonsToRemove': ['select2d', 'lasso2d']}
+
+    st.plotly_chart(commune_map, config=config, use_container_width=True)
+
+    # Dataframes & Code
+    communeCode = '''def dfValueCommune(df_cube, department):
+    store = loadGeometry(geometry.COMMUNES_GEOJSON)
+    commune_codes = store.codes(department)
+
+    communes = cube.query(df_cube, 'nom_commune', code_departement=department)
+    communes = communes.groupby(communes.index.map(geometry.nameKey).map(commune_codes)).sum()  # Arrondissements too
+
+    val_by_commune = cube.mean(communes, 'value_m2').rename("Property value / m²").dropna()
+    val_by_commune = val_by_commune.rename_axis('code').reset_index()
+    val_by_commune["Commune"] = val_by_commune["code"].map(store.names())
+    val_by_commune["Sales"] = val_by_commune["code"].map(communes['count'])
+
+    return val_by_commune
+
+# Dataframe & geometry: only the communes of the department are decoded and sent
+val_by_commune = dfValueCommune(df_cube, department)
+communes = loadGeometry(geometry.COMMUNES_GEOJSON).department(department)
+
+# Map
+commune_map = px.choropleth(val_by_commune,
+                            locations="code",
+                            geojson=communes,
+                            featureidkey="properties.code",
+                            color="Property value / m²",
+                            hover_name="Commune",
+                            hover_data=["Property value / m²", "Sales"])
+
+commune_map.update_geos(fitbounds="geojson", visible=False)
+
+config = {'displaylogo': False,
+          'modeBarButtonsToRemove': ['select2d', 'lasso2d']}
+
+st.plotly_chart(commune_map, config=config, use_container_width=True)'''
+
+    if showDetails('valueCommune'):
+        st.dataframe(val_by_commune)
+        st.code(communeCode, 'python')
+
+
 # %% Main Function
 
-@timeit
+@tracing.traced()
 def main():
     # Page configuration
 
@@ -842,167 +1052,287 @@ def main():
 
     # App header
 
-    st.title('Property values in France (2019/2020)')
+    registry = DatasetRegistry('.')
+
+    if not registry.years:
+        st.error('No full_<year>.csv file found.')
+        st.stop()
+
+    years = st.sidebar.multiselect('Years', registry.years, default=registry.years[-2:])
+    years = sorted(years)
+
+    period = st.sidebar.radio('Time series by', [period.capitalize() for period in periods.PERIODS], index=1).lower()
+
+    st.title('Property values in France (%s)' % yearsLabel(years))
+
+    if not years:
+        st.info('Select at least one year.')
+        st.stop()
 
     # Load data
 
-    df19 = loadData('full_2019.csv')
-    df20 = loadData('full_2020.csv')
+    versions = registry.versions(years)
 
-    loadCode = '''def loadData(url):
-    return pd.read_csv(url, sep=',', low_memory=False)
+    loadCode = '''class DatasetRegistry:
+    PATTERN = re.compile(r'^full_(\\d{4})\\.csv$')
+
+    def __init__(self, directory='.'):
+        self.directory = directory
+        self.urls = {}
+
+        for name in sorted(os.listdir(directory)):
+            match = self.PATTERN.match(name)
+            if match:
+                self.urls[match.group(1)] = os.path.join(directory, name)
+
+    def loadYear(self, year, version=None):
+        df = ingest.readColumns(self.urls[year])  # Typed parquet copy of the csv, built once per source version
+        return tagFrame(df, version or ingest.sourceKey(self.urls[year]))
+
+    def load(self, years, versions=None):
+        versions = versions or self.versions(years)
 
-df19 = loadData('full_2019.csv')
-df20 = loadData('full_2020.csv')'''
+        with ThreadPoolExecutor(max_workers=max(1, min(len(years), os.cpu_count() or 1))) as executor:
+            frames = executor.map(lambda year: self.loadYear(year, versions[year]), years)
+
+        return dict(zip(years, frames))
+
+registry = DatasetRegistry('.')
+frames = registry.load(years)'''
 
     st.header('Loading data')
 
     st.code(loadCode, 'python')
     if st.button('Show Dataframe', 0):
-        createTabs(df19, df20)
+        createTabs(loadYears('.', versions))  # Raw years are only read here, the app starts from the artifacts
 
     # Clean & transform data
 
     st.header('Cleaning & transforming data')
 
-    # Choose columns
+    dep = loadData("departements-france.csv")  # Departments & Regions
+    # Source : https://www.data.gouv.fr/fr/datasets/departements-de-france/
 
-    df19_cols, df20_cols = chooseCol(df19, df20)
+    pipeline = cleanData('.', versions, dep)
 
-    choiceColCode = '''def chooseCol(df1, df2):
-    cols = ['numero_disposition', 'date_mutation', 'nature_mutation', 'valeur_fonciere', 'code_postal', 'nom_commune',
-            'code_departement', 'nombre_lots', 'type_local', 'surface_reelle_bati', 'nombre_pieces_principales',
-            'surface_terrain', 'longitude', 'latitude']
+    pipelineCode = '''class CleaningPipeline:
+    def __init__(self, frames, dpt):
+        self.frames = frames  # {year: raw dataframe}
+        self.dpt = dpt
+        self.df = None
+        self.bounds = {}
+        self.views = {}
 
-    df1_copy = copy.deepcopy(df1[cols])  # I used a deepcopy not to
-    df2_copy = copy.deepcopy(df2[cols])  # mutate last cached outputs
+    def run(self):
+        for step in self.STEPS:
+            getattr(self, step)()
+            self.views[step] = {year: self.year(year).head() for year in self.bounds}
 
-    return df1_copy, df2_copy
+        return self
 
-df19_cols, df20_cols = chooseCol(df19, df20)'''
+    def year(self, year):
+        start, stop = self.bounds[year]
 
-    st.markdown('#### Choice of columns')
-    st.code(choiceColCode, 'python')
-    if st.button('Show Dataframe', 1):
-        createTabs(df19_cols, df20_cols)
+        return self.df.iloc[start:stop]
 
-    # Modify types
+pipeline = CleaningPipeline(frames, dep).run()  # Or CleaningPipeline.load(version, dep), saved by precompute.py'''
 
-    df19_modified, df20_modified = modifyTypes(df19_cols, df20_cols)
+    st.markdown('#### Cleaning pipeline')
+    st.code(pipelineCode, 'python')
 
-    modifTypeCode = '''def modifyTypes(df1, df2):
-    df1_copy = copy.deepcopy(df1)
-    df2_copy = copy.deepcopy(df2)
+    # Choose columns
 
-    df1_copy['date_mutation'] = pd.to_datetime(df1_copy['date_mutation'])
-    df1_copy['code_postal'] = df1_copy['code_postal'].apply(lambda x: str(x)[:-2].zfill(5))
-    df1_copy['code_departement'] = df1_copy['code_departement'].apply(lambda x: str(x).zfill(2))
+    choiceColCode = '''def chooseCol(self):
+    parts = [frame[ingest.COLS] for frame in self.frames.values()]
 
-    df2_copy['date_mutation'] = pd.to_datetime(df2_copy['date_mutation'])
-    df2_copy['code_postal'] = df2_copy['code_postal'].apply(lambda x: str(x)[:-2].zfill(5))
-    df2_copy['code_departement'] = df2_copy['code_departement'].apply(lambda x: str(x).zfill(2))
+    self.df = pd.concat(parts, ignore_index=True)  # The only copy of the data
+    self.setBounds([len(part) for part in parts])'''
 
-    return df1_copy, df2_copy
+    st.markdown('#### Choice of columns')
+    st.code(choiceColCode, 'python')
+    if st.button('Show Dataframe', 1):
+        createTabs(pipeline.views['chooseCol'])
 
-df19_modified, df20_modified = modifyTypes(df19_cols, df20_cols)'''
+    # Modify types
+
+    modifTypeCode = '''def modifyTypes(self):
+    self.df['date_mutation'] = pd.to_datetime(self.df['date_mutation'])
+    periods.addPeriods(self.df)  # Integer week / month / quarter keys, computed once for every time series
+    self.df['code_postal'] = codes.normalizePostalCode(self.df['code_postal'])
+    self.df['code_departement'] = codes.normalizeDepartmentCode(self.df['code_departement'])'''
 
     st.markdown('#### Modify wrong types')
     st.code(modifTypeCode, 'python')
     if st.button('Show Dataframe', 2):
-        createTabs(df19_modified, df20_modified)
+        createTabs(pipeline.views['modifyTypes'])
 
     # Add department_names column
 
-    dep = loadData("departements-france.csv")  # Departments & Regions
-    # Source : https://www.data.gouv.fr/fr/datasets/departements-de-france/
-
-    df19_complete, df20_complete = addDepName(df19_modified, df20_modified, dep)
-
-    depNameCode = '''def addDepName(df1, df2, dpt):
-    df1_copy = copy.deepcopy(df1)
-    df2_copy = copy.deepcopy(df2)
+    depNameCode = '''def addDepName(self):
+    table = dimensions.dimensionTable(self.dpt)
 
-    df1_copy["nom_departement"] = df1_copy["code_departement"].map(dpt.set_index("code_departement")["nom_departement"])
-    df2_copy["nom_departement"] = df2_copy["code_departement"].map(dpt.set_index("code_departement")["nom_departement"])
-
-    return df1_copy, df2_copy
-
-dep = loadData("departements-france.csv")  # Departments & Regions
-# Source : https://www.data.gouv.fr/fr/datasets/departements-de-france/
-
-df19_complete, df20_complete = addDepName(df19_modified, df20_modified, dep)'''
+    self.df["nom_departement"] = table.lookup(self.df["code_departement"], "nom_departement")
+    self.df["nom_region"] = table.lookup(self.df["code_departement"], "nom_region")'''
 
     st.markdown('#### New column with department name')
     st.code(depNameCode, 'python')
     if st.button('Show Dataframe', 3):
-        createTabs(df19_complete, df20_complete)
+        createTabs(pipeline.views['addDepName'])
 
     # Drop duplicates
 
-    df19_clean, df20_clean = deleteDuplicates(df19_complete, df20_complete)
+    dropDuplicateCode = '''def fingerprints(df, key=KEY):
+    return pd.util.hash_pandas_object(df[key], index=False).to_numpy()
 
-    dropDuplicateCode = '''def deleteDuplicates(df1, df2):
-    df1_copy = copy.deepcopy(df1).drop_duplicates()
-    df2_copy = copy.deepcopy(df2).drop_duplicates()
+def deleteDuplicates(self):
+    fps = dedup.fingerprints(self.df)
 
-    return df1_copy, df2_copy
+    if self.across_years:
+        keep = dedup.firstOccurrences(fps)
+    else:  # Duplicates within a year
+        keep = np.concatenate([dedup.firstOccurrences(fps[start:stop]) for start, stop in self.bounds.values()])
 
-df19_clean, df20_clean = deleteDuplicates(df19_complete, df20_complete)'''
+    self.dropRows(keep)'''
 
     st.markdown('#### Drop duplicates')
     st.code(dropDuplicateCode, 'python')
-    createTabs(df19_clean, df20_clean)
+    createTabs(pipeline.views['deleteDuplicates'])
+
+    # Compact types
+
+    compactCode = '''def compactTypes(self):
+    self.memory_before = schema.memoryUsage(self.df)
+    schema.compact(self.df)  # Categoricals, smallest nullable ints and float32
+    self.memory = schema.memoryReport(self.memory_before, schema.memoryUsage(self.df))'''
+
+    st.markdown('#### Compact types')
+    st.code(compactCode, 'python')
+    if st.button('Show memory saved per column', 4):
+        st.dataframe(pipeline.memory)
 
     # Concatenation
 
-    df_clean = concatenation(df19_clean, df20_clean)
+    concatenationCode = '''def concatenation(self):
+    pass  # Years already share one frame
 
-    concatenationCode = '''def concatenation(df1, df2):
-    df1_copy = copy.deepcopy(df1)
-    df2_copy = copy.deepcopy(df2)
-    
-    return pd.concat([df1_copy, df2_copy])
-    
-df_clean = concatenation(df19_clean, df20_clean)'''
+def rows(self):
+    with rows_lock:
+        if self.df is None:
+            self.df = tagFrame(pd.read_parquet(self.path), self.version)
+
+    return self.df
+
+df_clean = pipeline.rows()  # Read from disk by the first view showing rows
+frames_clean = {year: pipeline.year(year) for year in years}'''
 
     st.markdown('#### Concatenated dataframe')
     st.code(concatenationCode, 'python')
 
+    # Aggregate cube
+
+    cubes = aggregateData(pipeline.version, dep, pipeline)
+
+    cubeCode = '''ROLLUPS = {'department': (['year', 'quarter', 'month', 'week', 'code_departement', 'nom_departement', 'nom_region',
+                           'type_local'], {}),
+           'paris': (['year', 'code_departement', 'code_postal'], {'code_departement': ['75']}),
+           'versailles': (['year', 'quarter', 'month', 'week', 'nom_commune', 'type_local'],
+                          {'nom_commune': ['Versailles']}),
+           'commune': (['year', 'code_departement', 'nom_commune'], {})}  # Only for the map per commune
+
+def buildCube(df, dpt, rollups=ROLLUPS):
+    regions = df['nom_region'] if 'nom_region' in df.columns else \
+        dimensions.dimensionTable(dpt).lookup(df['code_departement'], 'nom_region')
+    keys = df[periods.PERIODS] if set(periods.PERIODS) <= set(df.columns) else periods.periodKeys(df['date_mutation'])
+
+    rows = pd.DataFrame({'year': df['date_mutation'].dt.year.astype('Int16'),
+                         'quarter': keys['quarter'],
+                         'month': keys['month'],
+                         'week': keys['week'],
+                         'code_departement': df['code_departement'],
+                         'nom_departement': df['nom_departement'],
+                         'nom_region': regions,
+                         'nom_commune': df['nom_commune'],
+                         'code_postal': df['code_postal'],
+                         'type_local': df['type_local']})
+
+    value = df['valeur_fonciere'].astype('float64')  # Stored as float32, summed in float64
+    surface = df['surface_reelle_bati'].astype('float64')
+    values = {'value': value,
+              'surface': surface,
+              'value_m2': (value / surface).where(surface > 0)}
+
+    aggregations = {'count': ('year', 'size')}
+    for measure, series in values.items():
+        rows[measure] = series
+        rows[measure + '_sq'] = series ** 2
+        aggregations.update({measure + '_n': (measure, 'count'),
+                             measure + '_sum': (measure, 'sum'),
+                             measure + '_sumsq': (measure + '_sq', 'sum'),
+                             measure + '_min': (measure, 'min'),
+                             measure + '_max': (measure, 'max')})
+
+    cubes = {}
+    for name, (by, kept) in rollups.items():
+        selected = rows
+        for dimension, values in kept.items():
+            selected = selected[selected[dimension].isin(values).to_numpy()]
+
+        cubes[name] = selected.groupby(by, dropna=False, observed=True, sort=False).agg(**aggregations).reset_index()
+
+    return cubes
+
+cubes = aggregateData(pipeline.version, dep, pipeline)  # Built once per dataset version and saved next to the data'''
+
+    st.markdown('#### Aggregated roll-ups used by the charts')
+    st.code(cubeCode, 'python')
+
     # Data visualization
 
     st.header('Data interpretation & visualization')
 
-    # Geographical representation of houses in the inner suburbs / value (2019/2020)
-
-    maisonMap(df_clean)
+    # Charts are only computed for the section picked in the sidebar
 
-    # Mean value for houses in the departments of Île-de-France excluding Paris (2019/2020)
+    sections = {
+        # Geographical representation of houses in the inner suburbs / value
+        'Map of houses': lambda: maisonMap(aggregateTiles(pipeline.version, pipeline), pipeline, years),
 
-    maisonBar(df19_clean, df20_clean)
+        # Sales comparable to a property, around a place
+        'Comparable sales': lambda: comparableSales(indexLocations(pipeline.rows()), years),
 
-    # Average price per square meter per district of Paris (2019/2020)
+        # Mean value for houses in the departments of Île-de-France excluding Paris
+        'Houses in Ile-de-France': lambda: maisonBar(cubes['department'], pipeline, years),
 
-    m2Paris(df19_clean, df20_clean)
+        # Average price per square meter per district of Paris
+        'Paris districts': lambda: m2Paris(cubes['paris'], pipeline, years),
 
-    # Average price per square meter of an apartment in Versailles over the months (2019/2020)
+        # Average price per square meter of an apartment in Versailles over the months
+        'Apartments in Versailles': lambda: appartVersailles(cubes['versailles'], pipeline, years, period),
 
-    appartVersailles(df_clean)
+        # Evolution of the number of sales by type of premises over the months
+        'Sales by type': lambda: salesType(cubes['department'], years, period),
 
-    # Evolution of the number of sales by type of premises over the months (2019/2020)
+        # Heat map of the number of sales by month and by region
+        'Sales by region': lambda: salesRegion(cubes['department'], years, period),
 
-    salesType(df_clean)
+        # Distribution of apartments among the 10 departments which have the most (Average over the years)
+        'Departments with the most apartments': lambda: mostApartments(cubes['department'], years),
 
-    # Heat map of the number of sales by month and by region across 2019 and 2020
+        # Choropleth map of the average real surface per department in metropolitan France
+        'Surface per department': lambda: surfaceDep(cubes['department'], years),
 
-    salesRegion(df_clean, dep)
+        # Choropleth map of the average price per square meter per commune of a department
+        'Price per commune': lambda: valueCommune(cubes['commune'], years)}
 
-    # Distribution of apartments among the 10 departments which have the most (Average for 2019 and 2020)
+    shown = st.sidebar.radio('Chart', list(sections) + ['All charts'])
 
-    mostApartments(df19_clean, df20_clean)
+    for name, section in sections.items():
+        if shown in (name, 'All charts'):
+            section()
 
-    # Choropleth map of the average real surface per department in metropolitan France (2019/2020)
+    # Developer panel
 
-    surfaceDep(df_clean)
+    if st.sidebar.checkbox('Show spans (developer)'):
+        tracePanel()
 
 
 if __name__ == "__main__":
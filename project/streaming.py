@@ -0,0 +1,111 @@
+# Importations & Settings
+
+import argparse
+import os
+import uuid
+
+import pandas as pd
+
+import dedup
+import dimensions
+import ingest
+from pipeline import CleaningPipeline, tagFrame
+
+STORE_DIR = os.path.join(ingest.CACHE_DIR, 'dvf')
+CHUNK_SIZE = 500000
+PARTITIONS = ['year', 'code_departement']
+
+
+# %% Streaming ingest
+
+def readChunks(url, chunksize=CHUNK_SIZE):
+    return pd.read_csv(url, sep=',', usecols=ingest.COLS, chunksize=chunksize,
+                       dtype={col: ingest.DTYPES[col] for col in ingest.COLS if col in ingest.DTYPES},
+                       parse_dates=['date_mutation'])
+
+
+def cleanChunk(chunk, dpt):
+    pipeline = CleaningPipeline({None: tagFrame(chunk, 'chunk')}, dpt)  # No cache key needed, skip hashing the chunk
+
+    for step in ['chooseCol', 'modifyTypes', 'addDepName']:
+        getattr(pipeline, step)()
+
+    df = pipeline.df
+    df['year'] = df['date_mutation'].dt.year.astype('Int16')
+
+    return df
+
+
+def streamIngest(url, dpt, store=STORE_DIR, chunksize=CHUNK_SIZE, across_years=False):
+    """Clean a DVF csv chunk by chunk into a parquet dataset partitioned by year and department.
+
+    Only one chunk is in memory at a time, whatever the size of the csv. What an earlier run wrote for this file is
+    replaced, so a corrected release replaces its own rows. Duplicated rows are skipped using the fingerprints of the
+    earlier chunks of the file, as CleaningPipeline deduplicates within each year; with across_years, rows already
+    ingested from the other files are skipped too. Returns the number of rows written.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    stem = ingest.fileStem(url)
+    rows = 0
+
+    for root, _, names in os.walk(store):  # Replace what a previous run wrote for this file, fingerprints included
+        for name in names:
+            if name.startswith(stem + '-'):
+                os.remove(os.path.join(root, name))
+
+    others = None if across_years else []  # Fingerprints of the other files, or none
+    index = dedup.DedupIndex(dedupPath(store), others)
+
+    for number, chunk in enumerate(readChunks(url, chunksize)):
+        df = cleanChunk(chunk, dpt)
+
+        fps = dedup.fingerprints(df)
+        keep = index.unseen(fps)
+        df = df[keep]
+
+        if df.empty:
+            continue
+        df['code_departement'] = df['code_departement'].astype(object)  # Null codes go to '__HIVE_DEFAULT_PARTITION__'
+
+        # Without the pandas metadata, partition columns are read back as categoricals whatever their written dtype
+        table = pa.Table.from_pandas(df, preserve_index=False).replace_schema_metadata(None)
+        pq.write_to_dataset(table, store, partition_cols=PARTITIONS,
+                            basename_template='%s-%05d-%s-{i}.parquet' % (stem, number, uuid.uuid4().hex[:8]))
+        rows += len(df)
+
+        index.add(fps[keep], stem, number)  # Saved once the rows it refers to are written
+
+    return rows
+
+
+def dedupPath(store=STORE_DIR):
+    return os.path.join(store, '_dedup')  # '_' directories are ignored when the dataset is read
+
+
+def readPartitions(store=STORE_DIR, years=None, departments=None, columns=None):
+    """Read the rows of some years / departments only, the other partitions are not opened."""
+    filters = []
+    if years is not None:
+        filters.append(('year', 'in', [int(year) for year in years]))
+    if departments is not None:
+        filters.append(('code_departement', 'in', list(departments)))
+
+    return pd.read_parquet(store, columns=columns, filters=filters or None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Stream DVF csv files into a partitioned parquet dataset.')
+    parser.add_argument('csv', nargs='+')
+    parser.add_argument('--store', default=STORE_DIR)
+    parser.add_argument('--chunksize', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--departments', default=dimensions.DEPARTMENTS_CSV)
+    parser.add_argument('--across-years', action='store_true', help='Also skip rows ingested from the other files')
+    args = parser.parse_args()
+
+    dep = pd.read_csv(args.departments, sep=',')
+
+    for path in args.csv:
+        print('%s: %d rows' % (path, streamIngest(path, dep, args.store, args.chunksize,
+                                                      args.across_years)))
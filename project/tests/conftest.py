@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# The app's modules are imported by name, from the project directory
+PROJECT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT)
+
+
+@pytest.fixture(scope='session')
+def dpt():
+    return pd.read_csv(os.path.join(PROJECT, 'departements-france.csv'), sep=',')
+
+
+@pytest.fixture(scope='session')
+def cleaned(dpt):
+    """Cleaned pipeline of two synthetic years, shared read-only by the tests."""
+    import bench
+    from pipeline import CleaningPipeline
+
+    return CleaningPipeline(bench.syntheticFrames(20000), dpt).run()
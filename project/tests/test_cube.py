@@ -0,0 +1,27 @@
+import pandas as pd
+
+import cube
+
+
+def test_rollups_answer_the_charts_as_the_full_cube(cleaned, dpt):
+    full = cube.buildCube(cleaned.df, dpt, {'full': (cube.DIMENSIONS, {})})['full']
+    cubes = cube.buildCube(cleaned.df, dpt)
+
+    queries = [('department', 'nom_departement', {'year': 2019, 'type_local': 'Maison', 'code_departement': ['78']}),
+               ('department', ['type_local', 'week'], {}),
+               ('department', ['nom_region', 'month'], {}),
+               ('department', 'code_departement', {}),
+               ('paris', 'code_postal', {'year': 2020, 'code_departement': '75'}),
+               ('versailles', 'quarter', {'nom_commune': 'Versailles', 'type_local': 'Appartement'}),
+               ('commune', 'nom_commune', {'code_departement': '78'})]
+
+    for name, by, filters in queries:
+        pd.testing.assert_frame_equal(cube.query(cubes[name], by, **filters), cube.query(full, by, **filters))
+
+
+def test_rollups_are_smaller_than_the_full_cube(cleaned, dpt):
+    full = cube.buildCube(cleaned.df, dpt, {'full': (cube.DIMENSIONS, {})})['full']
+    cubes = cube.buildCube(cleaned.df, dpt)
+
+    assert len(cubes['paris']) + len(cubes['versailles']) < len(full) / 50
+    assert max(len(rollup) for rollup in cubes.values()) < len(full)
@@ -0,0 +1,22 @@
+import json
+import os
+
+import numpy as np
+
+import geometry
+from conftest import PROJECT
+
+
+def test_simplified_rings_stay_polygons():
+    with open(os.path.join(PROJECT, geometry.DEPARTMENTS_GEOJSON)) as file:
+        features = json.load(file)['features']
+
+    for tolerance in geometry.LEVELS.values():
+        arrays = geometry.encode(features, tolerance)
+        assert (np.diff(arrays['rings']) >= 4).all()
+
+
+def test_small_ring_is_kept_whole():
+    ring = np.array([[0, 0], [1, 0], [1, 1e-9], [0.5, 2e-9], [0, 1e-9], [0, 0]], dtype='float64')
+
+    assert len(geometry.simplifyRing(ring, 0.1)) == len(ring)
@@ -0,0 +1,24 @@
+import json
+import subprocess
+import sys
+
+from conftest import PROJECT
+
+HEAVY = ['altair', 'plotly.express', 'polars', 'duckdb']  # Imported by the first chart or query that needs them
+IMPORT_BUDGET = 4.0  # Seconds, streamlit and pandas included
+
+SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import st_valeurs_foncieres
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds, 'loaded': [name for name in %r if name in sys.modules]}))
+''' % HEAVY
+
+
+def test_app_import_is_light():
+    output = subprocess.run([sys.executable, '-c', SCRIPT], cwd=PROJECT, capture_output=True, text=True, check=True)
+    report = json.loads(output.stdout.strip().splitlines()[-1])
+
+    assert report['loaded'] == []
+    assert report['seconds'] < IMPORT_BUDGET
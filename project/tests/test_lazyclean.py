@@ -0,0 +1,36 @@
+import pandas as pd
+import pytest
+
+import bench
+import ingest
+import lazyclean
+from pipeline import CleaningPipeline
+from registry import DatasetRegistry
+
+pytest.importorskip('polars')
+pytest.importorskip('pyarrow')
+
+
+@pytest.fixture(scope='module')
+def registry(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('dvf')
+    for year, df in bench.syntheticFrames(10000).items():
+        df.to_csv(directory / ('full_%s.csv' % year), index=False)
+
+    return DatasetRegistry(str(directory))
+
+
+@pytest.mark.parametrize('across_years', [False, True])
+def test_polars_cleaning_matches_the_pipeline(registry, dpt, across_years):
+    versions = registry.versions(registry.years)
+    expected = CleaningPipeline(registry.load(registry.years, versions), dpt, across_years=across_years).run()
+    pipeline = lazyclean.cleanYears({year: ingest.ingest(url) for year, url in registry.urls.items()}, dpt, versions,
+                                    across_years)
+
+    pd.testing.assert_frame_equal(pipeline.df, expected.df)
+    assert pipeline.bounds == expected.bounds
+    assert pipeline.version == expected.version
+
+    for step, views in expected.views.items():
+        for year, view in views.items():
+            pd.testing.assert_frame_equal(pipeline.views[step][year], view)
@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+
+from periods import periodKeys
+
+
+def test_week_keys_match_isocalendar():
+    dates = pd.Series(pd.date_range('2014-01-01', '2024-12-31', freq='D'))
+    iso = dates.dt.isocalendar()
+
+    keys = periodKeys(dates)
+
+    np.testing.assert_array_equal(keys['week'], iso['year'].astype('int64') * 100 + iso['week'].astype('int64'))
+    np.testing.assert_array_equal(keys['month'], dates.dt.year * 100 + dates.dt.month)
+    np.testing.assert_array_equal(keys['quarter'], dates.dt.year * 10 + dates.dt.quarter)
+
+
+def test_missing_dates_have_no_keys():
+    dates = pd.Series(pd.to_datetime(['2020-12-31', None, '2021-01-04']))
+
+    keys = periodKeys(dates)
+
+    assert keys['week'].isna().tolist() == [False, True, False]
+    assert keys['week'].dropna().tolist() == [202053, 202101]
@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+
+from pipeline import CleaningPipeline, frameKey, tagFrame
+
+
+def test_derived_frames_are_not_keyed_on_the_version():
+    df = tagFrame(pd.DataFrame({'value': [1.0, 2.0, 3.0]}), 'v1')
+    rows = df[df['value'] > 1]
+
+    assert frameKey(df) == 'v1'
+    assert rows.attrs['version'] == 'v1'  # Copied by pandas
+    assert frameKey(rows) != 'v1'
+    assert frameKey(rows) != frameKey(df.iloc[:1])
+
+
+def test_content_key_tells_columns_and_order_apart():
+    df = pd.DataFrame({'a': [1.0, 2.0], 'b': [3.0, 4.0]})
+    keys = [frameKey(df), frameKey(df.rename(columns={'a': 'c'})), frameKey(df.iloc[::-1]),
+            frameKey(df[['b', 'a']]), frameKey(df.astype({'a': 'float32'}))]
+
+    assert len(set(keys)) == len(keys)
+    assert frameKey(df.copy()) == frameKey(df)
+
+
+def test_tagged_derived_frames_keep_their_own_key():
+    df = tagFrame(pd.DataFrame({'value': [1.0, 2.0, 3.0]}), 'v1')
+    rows = tagFrame(df.iloc[1:], 'v1:rows')
+
+    assert frameKey(rows) == 'v1:rows'
+    assert frameKey(df) == 'v1'
+
+
+def test_loaded_pipeline_reads_its_rows_on_first_use(cleaned, dpt, tmp_path):
+    pytest.importorskip('pyarrow')
+    cleaned.save(str(tmp_path))
+
+    pipeline = CleaningPipeline.load(cleaned.version, dpt, str(tmp_path))
+
+    assert pipeline.df is None
+    assert pipeline.bounds == cleaned.bounds
+    pd.testing.assert_frame_equal(pipeline.year('2020'), cleaned.year('2020'))
+    assert frameKey(pipeline.rows()) == cleaned.version
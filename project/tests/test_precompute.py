@@ -0,0 +1,28 @@
+import os
+import shutil
+
+import pytest
+
+import bench
+import cube
+import dimensions
+import geometry
+import precompute
+import sqlengine
+from conftest import PROJECT
+
+pytest.importorskip('pyarrow')
+
+
+def test_rollups_are_persisted_whatever_the_engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlengine, 'ENGINE', 'duckdb')
+    monkeypatch.chdir(tmp_path)  # precompute runs from the data directory, as the app
+    for name in [dimensions.DEPARTMENTS_CSV, geometry.DEPARTMENTS_GEOJSON]:
+        shutil.copy(os.path.join(PROJECT, name), str(tmp_path))
+    for year, df in bench.syntheticFrames(4000).items():
+        df.to_csv(tmp_path / ('full_%s.csv' % year), index=False)
+
+    manifest = precompute.precompute('.', ['2019', '2020'])
+
+    for name in cube.ROLLUPS:
+        assert os.path.basename(cube.cubePath(manifest['version'], name)) in manifest['artifacts']
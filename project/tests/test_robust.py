@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+import robust
+
+
+def test_mutations_merge_the_lots_of_a_sale():
+    # Two sales on the same day, at the same price and place: only id_mutation tells them apart
+    df = pd.DataFrame({'id_mutation': ['2020-1', '2020-1', '2020-2', '2020-2'],
+                       'numero_disposition': [1, 1, 1, 2],
+                       'date_mutation': pd.to_datetime(['2020-01-02'] * 4),
+                       'valeur_fonciere': [300000.0] * 4,
+                       'nom_commune': ['Versailles'] * 4,
+                       'code_postal': ['78000'] * 4,
+                       'surface_reelle_bati': [40.0, 20.0, np.nan, 50.0]})
+
+    sales = robust.mutations(df)
+
+    assert sales['id_mutation'].tolist() == ['2020-1', '2020-2', '2020-2']
+    assert sales['surface_reelle_bati'].iloc[0] == 60.0
+    assert np.isnan(sales['surface_reelle_bati'].iloc[1])
+    assert sales['surface_reelle_bati'].iloc[2] == 50.0
+
+
+def test_group_stats_match_pandas():
+    rng = np.random.default_rng(0)
+    keys = pd.Series(rng.choice(['a', 'b', 'c'], 1000), name='key')
+    values = rng.lognormal(8, 1, 1000)
+
+    stats = robust.groupStats(keys, values)
+    grouped = pd.Series(values).groupby(keys)
+
+    np.testing.assert_allclose(stats['mean'], grouped.mean())
+    np.testing.assert_allclose(stats['median'], grouped.median())
+    np.testing.assert_allclose(stats['q25'], grouped.quantile(0.25))
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from spatial import SpatialIndex, haversine
+
+
+def randomPoints(n, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'latitude': rng.normal(48.85, 0.2, n), 'longitude': rng.normal(2.35, 0.3, n),
+                       'type_local': rng.choice(['Maison', 'Appartement'], n)})
+    df.loc[rng.choice(n, n // 20, replace=False), 'latitude'] = np.nan  # Rows without coordinates are not indexed
+
+    return df
+
+
+def bruteNearest(df, latitude, longitude, k):
+    distances = pd.Series(haversine(latitude, longitude, df['latitude'], df['longitude']), index=df.index).dropna()
+
+    return distances.sort_values(kind='stable')[:k]
+
+
+def test_nearest_matches_brute_force():
+    df = randomPoints(5000)
+    index = SpatialIndex(df)
+
+    for latitude, longitude in [(48.85, 2.35), (49.4, 3.1), (47.0, 0.0), (48.86, 2.3)]:
+        for k in [1, 7, 100]:
+            expected = bruteNearest(df, latitude, longitude, k)
+            result = index.nearest(latitude, longitude, k)
+
+            assert result.index.tolist() == expected.index.tolist()
+            np.testing.assert_allclose(result['distance'], expected.to_numpy())
+
+
+def test_nearest_with_a_filter_matches_brute_force():
+    df = randomPoints(5000, seed=1)
+    index = SpatialIndex(df)
+    houses = df[df['type_local'] == 'Maison']
+
+    result = index.nearest(48.9, 2.4, 25, where=lambda rows: rows['type_local'] == 'Maison')
+
+    assert result.index.tolist() == bruteNearest(houses, 48.9, 2.4, 25).index.tolist()
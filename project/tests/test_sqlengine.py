@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import cube
+import sqlengine
+
+pytest.importorskip('duckdb')
+pytest.importorskip('pyarrow')
+
+QUERIES = [('department', 'nom_departement', {'year': 2019, 'type_local': 'Maison', 'code_departement': ['78', '92']}),
+           ('department', ['type_local', 'month'], {}),
+           ('department', ['nom_region', 'week'], {}),
+           ('department', ['nom_departement', 'year'], {'type_local': 'Appartement'}),
+           ('department', 'code_departement', {}),
+           ('paris', 'code_postal', {'year': 2020, 'code_departement': '75'}),
+           ('versailles', 'quarter', {'nom_commune': 'Versailles', 'type_local': 'Appartement'}),
+           ('commune', 'nom_commune', {'code_departement': '78'}),
+           ('department', 'type_local', {'code_departement': []})]
+
+
+def plain(agg):
+    """Keys as plain values, sorted, measures as float: the SQL and pandas roll-ups only differ in these."""
+    agg = agg.reset_index()
+    keys = list(agg.columns[:agg.columns.get_loc('count')])
+    for key in keys:
+        agg[key] = agg[key].astype(object).where(agg[key].notna(), None)
+        agg[key] = agg[key].map(lambda value: int(value) if isinstance(value, (int, np.integer)) else value)
+
+    return agg.sort_values(keys, key=lambda column: column.astype(str)).reset_index(drop=True).astype(
+        {column: 'float64' for column in agg.columns[len(keys):]})
+
+
+def test_sql_rollups_match_pandas(cleaned, dpt, tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlengine, 'ENGINE', 'duckdb')
+    cleaned.save(str(tmp_path))
+
+    sql = cube.loadCube(cleaned.rows, dpt, cleaned.version, str(tmp_path))
+    cubes = cube.buildCube(cleaned.df, dpt)
+
+    assert all(len(rollup) == 0 for rollup in sql.values())  # Nothing loaded in pandas
+    for name, by, filters in QUERIES:
+        expected = plain(cube.query(cubes[name], by, **filters))
+        result = plain(cube.query(sql[name], by, **filters))
+
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False, rtol=1e-9)
@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dedup
+import ingest
+import streaming
+
+pytest.importorskip('pyarrow')
+
+
+def writeYear(path, values):
+    rows = pd.DataFrame({col: [None] * len(values) for col in ingest.COLS})
+    rows['numero_disposition'] = 1
+    rows['date_mutation'] = '2020-01-02'
+    rows['valeur_fonciere'] = values
+    rows['code_postal'] = 75001
+    rows['nom_commune'] = 'Paris'
+    rows['code_departement'] = '75'
+    rows['type_local'] = 'Appartement'
+    rows.to_csv(path, index=False)
+
+    return str(path)
+
+
+def test_duplicates_are_skipped_within_a_file(tmp_path, dpt):
+    store = str(tmp_path / 'store')
+    first = writeYear(tmp_path / 'full_2019.csv', [1, 2, 1, 3, 2, 4])
+    second = writeYear(tmp_path / 'full_2020.csv', [1, 5])
+
+    assert streaming.streamIngest(first, dpt, store, chunksize=2) == 4  # Duplicates span chunks
+    assert len(os.listdir(streaming.dedupPath(store))) == 3  # One run per written chunk
+    assert streaming.streamIngest(second, dpt, store, chunksize=2) == 2  # Other files are not checked by default
+
+    assert len(streaming.readPartitions(store)) == 6
+
+
+def test_corrected_release_replaces_its_rows(tmp_path, dpt):
+    store = str(tmp_path / 'store')
+    path = writeYear(tmp_path / 'full_2019.csv', [1, 2, 3])
+    other = writeYear(tmp_path / 'full_2020.csv', [1, 9])
+
+    streaming.streamIngest(path, dpt, store, chunksize=2)
+    streaming.streamIngest(other, dpt, store, chunksize=2)
+    writeYear(path, [1, 2, 7])
+    assert streaming.streamIngest(path, dpt, store, chunksize=2) == 3
+
+    values = sorted(streaming.readPartitions(store)['valeur_fonciere'])
+    assert values == [1, 1, 2, 7, 9]
+
+
+def test_across_years_skips_rows_of_other_files(tmp_path, dpt):
+    store = str(tmp_path / 'store')
+    first = writeYear(tmp_path / 'full_2019.csv', [1, 2])
+    second = writeYear(tmp_path / 'full_2020.csv', [1, 5, 5])
+
+    streaming.streamIngest(first, dpt, store)
+    assert streaming.streamIngest(second, dpt, store, across_years=True) == 1
+
+
+def test_mutations_with_the_same_dispositions_are_duplicates(tmp_path, dpt):
+    path = writeYear(tmp_path / 'full_2019.csv', [1, 1])
+    df = pd.read_csv(path)
+    df['id_mutation'] = ['2019-1', '2019-2']
+    df.to_csv(path, index=False)
+
+    assert streaming.streamIngest(path, dpt, str(tmp_path / 'store')) == 1
+
+
+def test_runs_of_another_key_format_are_ignored(tmp_path):
+    directory = str(tmp_path)
+    np.save(os.path.join(directory, 'full_2019-00000.npy'), np.array([1, 2], dtype=np.uint64))  # Before FORMAT
+    dedup.DedupIndex(directory).add(np.array([3], dtype=np.uint64), 'full_2019', 1)
+
+    index = dedup.DedupIndex(directory, ['full_2019'])
+
+    assert len(index) == 1
+    assert index.contains(np.array([1, 3], dtype=np.uint64)).tolist() == [False, True]
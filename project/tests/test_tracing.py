@@ -0,0 +1,18 @@
+import os
+
+import tracing
+
+
+def test_trace_file_is_rotated(tmp_path, monkeypatch):
+    path = str(tmp_path / 'traces.jsonl')
+    monkeypatch.setattr(tracing, 'TRACE_FILE', path)
+    monkeypatch.setattr(tracing, 'TRACE_MAX_BYTES', 1000)
+
+    for _ in range(100):
+        with tracing.span('run'):
+            pass
+    tracing.pending.join()
+
+    assert os.path.getsize(path) < 1000 + 200  # One record past the limit at most
+    assert os.path.getsize(path + '.1') < 1000 + 200
+    assert not os.path.exists(path + '.2')
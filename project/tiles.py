@@ -0,0 +1,111 @@
+# Importations & Settings
+
+import os
+
+import numpy as np
+import pandas as pd
+
+import ingest
+
+
+# %% Grid definition
+
+ZOOMS = [6, 8, 10, 12, 14]  # Web map zoom levels: 6 shows France, 14 a few streets
+CELL_PX = 32  # Bin size on screen, in pixels
+VALUE_STEP = 25000  # Same step as the value slider, so thresholds fall on bucket edges
+VALUE_BUCKETS = 200  # Values >= 5,000,000 share the last bucket
+EARTH_CIRCUMFERENCE = 40075016.686  # Meters
+
+
+def cellsPerSide(zoom):
+    return 2 ** zoom * 256 // CELL_PX
+
+
+def cellCoordinates(latitude, longitude, zoom):
+    """Web Mercator cell of each point at a zoom level."""
+    n = cellsPerSide(zoom)
+    lat = np.radians(np.clip(latitude, -85.05, 85.05))
+
+    x = np.floor((longitude + 180) / 360 * n)
+    y = np.floor((1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * n)
+
+    return x.astype('int32'), y.astype('int32')
+
+
+def cellSize(zoom, latitude):
+    return EARTH_CIRCUMFERENCE * np.cos(np.radians(latitude)) / cellsPerSide(zoom)
+
+
+# %% Build
+
+def buildTiles(df, type_local='Maison'):
+    """Bin the geolocated rows of one type of premises at every zoom level.
+
+    One row per zoom, department, cell and value bucket, with the count, the value sum and the coordinate sums, so a
+    threshold on the value is a filter on the bucket followed by a sum per cell.
+    """
+    houses = df[df['type_local'] == type_local]
+    houses = houses[['code_departement', 'valeur_fonciere', 'latitude', 'longitude']].dropna()
+
+    latitude = houses['latitude'].to_numpy('float64')
+    longitude = houses['longitude'].to_numpy('float64')
+    value = houses['valeur_fonciere'].to_numpy('float64')
+    bucket = np.minimum(value // VALUE_STEP, VALUE_BUCKETS).astype('int16')
+
+    levels = []
+    for zoom in ZOOMS:
+        x, y = cellCoordinates(latitude, longitude, zoom)
+        cells = pd.DataFrame({'zoom': np.int8(zoom), 'code_departement': houses['code_departement'].to_numpy(),
+                              'x': x, 'y': y, 'bucket': bucket, 'value': value,
+                              'latitude': latitude, 'longitude': longitude})
+
+        levels.append(cells.groupby(['zoom', 'code_departement', 'x', 'y', 'bucket'], observed=True)
+                      .agg(count=('value', 'size'), value=('value', 'sum'),
+                           latitude=('latitude', 'sum'), longitude=('longitude', 'sum'))
+                      .reset_index())
+
+    return pd.concat(levels, ignore_index=True)
+
+
+def tilesPath(version, directory='.'):
+    return os.path.join(directory, ingest.CACHE_DIR, 'tiles-%s.parquet' % version)
+
+
+def loadTiles(rows, version, directory='.'):
+    """Read the bins of a dataset version from disk, building and persisting them on first use.
+
+    rows() returns the cleaned frame: it is only called when the bins have to be built.
+    """
+    path = tilesPath(version, directory)
+
+    if ingest.HAS_PARQUET and os.path.exists(path):
+        return pd.read_parquet(path)
+
+    df_tiles = buildTiles(rows())
+
+    if ingest.HAS_PARQUET:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df_tiles.to_parquet(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+
+    return df_tiles
+
+
+# %% Queries
+
+def queryTiles(df_tiles, zoom, min_value=0, departments=None):
+    """Bins of a zoom level for the points worth at least min_value: centroid, count, mean value and a radius."""
+    cells = df_tiles[(df_tiles['zoom'] == zoom) & (df_tiles['bucket'] >= min_value // VALUE_STEP)]
+
+    if departments is not None:
+        cells = cells[cells['code_departement'].isin(departments)]
+
+    bins = cells.groupby(['x', 'y'])[['count', 'value', 'latitude', 'longitude']].sum()
+    bins['latitude'] /= bins['count']
+    bins['longitude'] /= bins['count']
+    bins['value'] /= bins['count']
+
+    # Radius in meters: half a cell for the densest bin, smaller for the others
+    bins['size'] = cellSize(zoom, bins['latitude']) / 2 * np.sqrt(bins['count'] / max(bins['count'].max(), 1))
+
+    return bins.reset_index(drop=True)
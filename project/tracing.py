@@ -0,0 +1,212 @@
+# Importations & Settings
+
+import collections
+import contextlib
+import functools
+import json
+import os
+import queue
+import threading
+import time
+
+import ingest
+
+# One JSON line per script run, written by a background thread. An empty DVF_TRACE disables the file
+TRACE_FILE = os.environ.get('DVF_TRACE', os.path.join(ingest.CACHE_DIR, 'traces.jsonl'))
+TRACE_MAX_BYTES = 10 * 2 ** 20  # Past this size the file is moved to TRACE_FILE.1, replacing the previous one
+RECENT_RUNS = 50
+
+try:
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    PAGE_SIZE = None
+
+
+# %% Spans
+
+def residentMemory():
+    """Resident set size in bytes, None where /proc is not available."""
+    if PAGE_SIZE is None:
+        return None
+
+    try:
+        with open('/proc/self/statm', 'rb') as file:
+            return int(file.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def rowCount(value):
+    return len(value) if hasattr(value, 'shape') and hasattr(value, '__len__') else None
+
+
+class Span:
+    __slots__ = ('name', 'depth', 'start', 'duration', 'cache', 'rows_in', 'rows_out', 'memory', 'error')
+
+    def __init__(self, name, depth):
+        self.name = name
+        self.depth = depth
+        self.start = time.perf_counter()
+        self.duration = None
+        self.cache = None  # 'hit' or 'miss' for cached functions
+        self.rows_in = None
+        self.rows_out = None
+        self.memory = residentMemory()  # RSS at the start, then the change over the span
+        self.error = None
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.start
+        memory = residentMemory()
+        self.memory = None if memory is None or self.memory is None else memory - self.memory
+
+    def record(self):
+        return {'name': self.name, 'depth': self.depth, 'ms': round(1000 * self.duration, 2), 'cache': self.cache,
+                'rows_in': self.rows_in, 'rows_out': self.rows_out,
+                'memory_mb': None if self.memory is None else round(self.memory / 2 ** 20, 1), 'error': self.error}
+
+
+class Trace:
+    """Spans of one script run, in the order they finished."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.stack = []
+        self.spans = []
+
+    def records(self):
+        return [span.record() for span in self.spans]
+
+
+# %% Collector
+# Each Streamlit script run executes on its own thread: the running trace is thread-local, finished traces are shared
+
+local = threading.local()
+recent = collections.deque(maxlen=RECENT_RUNS)
+pending = queue.Queue()
+writer = None
+writer_lock = threading.Lock()
+
+
+def currentTrace():
+    return getattr(local, 'trace', None)
+
+
+def lastTrace():
+    return recent[-1] if recent else None
+
+
+def flush():
+    """Append the finished traces to TRACE_FILE, run by the writer thread only. At most two files are kept: the
+    current one and the previous one, each about TRACE_MAX_BYTES."""
+    while True:
+        trace = pending.get()
+        try:
+            os.makedirs(os.path.dirname(TRACE_FILE) or '.', exist_ok=True)
+            if os.path.exists(TRACE_FILE) and os.path.getsize(TRACE_FILE) >= TRACE_MAX_BYTES:
+                os.replace(TRACE_FILE, TRACE_FILE + '.1')
+            with open(TRACE_FILE, 'a') as file:
+                file.write(json.dumps({'time': trace.started, 'spans': trace.records()}) + '\n')
+        except OSError:
+            pass  # Tracing must never break the app
+        finally:
+            pending.task_done()
+
+
+def publish(trace):
+    global writer
+
+    recent.append(trace)
+    if not TRACE_FILE:
+        return
+
+    with writer_lock:
+        if writer is None:
+            writer = threading.Thread(target=flush, name='trace-writer', daemon=True)
+            writer.start()
+    pending.put(trace)
+
+
+@contextlib.contextmanager
+def span(name, rows_in=None):
+    """Time a block as a span of the running trace. The outermost span starts the trace and publishes it."""
+    trace = currentTrace()
+    root = trace is None
+    if root:
+        trace = local.trace = Trace()
+
+    record = Span(name, len(trace.stack))
+    record.rows_in = rows_in
+    trace.stack.append(record)
+
+    try:
+        yield record
+    except BaseException as error:
+        record.error = type(error).__name__
+        raise
+    finally:
+        record.finish()
+        trace.stack.pop()
+        trace.spans.append(record)
+
+        if root:
+            local.trace = None
+            publish(trace)
+
+
+def traced(cache=None):
+    """Decorator: one span per call, with rows in (frame arguments) and rows out.
+
+    cache is an optional Streamlit cache decorator (st.cache_data(...)): the function is cached under it and the span
+    tells hits from misses, the body only runs on a miss. `__wrapped__` is the undecorated function.
+    """
+    def decorate(function):
+        if cache is None:
+            cached = function
+        else:
+            @functools.wraps(function)
+            def body(*args, **kwargs):
+                trace = currentTrace()
+                if trace and trace.stack:
+                    trace.stack[-1].cache = 'miss'
+                return function(*args, **kwargs)
+
+            cached = cache(body)
+
+        @functools.wraps(function)
+        def call(*args, **kwargs):
+            rows = [rowCount(arg) for arg in args if rowCount(arg) is not None]
+
+            with span(function.__name__, sum(rows) if rows else None) as record:
+                if cache is not None:
+                    record.cache = 'hit'
+                result = cached(*args, **kwargs)
+                record.rows_out = rowCount(result)
+
+            return result
+
+        call.__wrapped__ = function
+        return call
+
+    return decorate
+
+
+# %% Summary
+
+def summary(traces=None):
+    """Count, mean and max duration and hit rate per span name over the recent runs."""
+    stats = collections.OrderedDict()
+
+    for trace in traces if traces is not None else list(recent):
+        for record in trace.records():
+            entry = stats.setdefault(record['name'], {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'hits': 0,
+                                                      'cached': 0})
+            entry['calls'] += 1
+            entry['total_ms'] += record['ms']
+            entry['max_ms'] = max(entry['max_ms'], record['ms'])
+            entry['hits'] += record['cache'] == 'hit'
+            entry['cached'] += record['cache'] is not None
+
+    return [{'name': name, 'calls': entry['calls'], 'mean_ms': round(entry['total_ms'] / entry['calls'], 2),
+             'max_ms': entry['max_ms'],
+             'hit_rate': round(entry['hits'] / entry['cached'], 2) if entry['cached'] else None}  # Cached only
+            for name, entry in stats.items()]